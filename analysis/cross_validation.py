@@ -1,5 +1,6 @@
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import RepeatedKFold, RepeatedStratifiedKFold
+from analysis.sorted_index import sorted_percentile
 
 
 class CrossValidationStrategy():
@@ -9,7 +10,8 @@ class CrossValidationStrategy():
     _nb_cross_validations: int
     _data: pd.DataFrame
     _random_state = None
-    _cross_validations: list # list of dict('train', 'test')
+    _cross_validations: list # list of dict('train', 'test') of sample labels
+    _fold_positions: list # list of dict('train', 'test') of integer positions in data
     
     def __init__(
             self, 
@@ -23,6 +25,7 @@ class CrossValidationStrategy():
         self._nb_cross_validations = nb_cross_validations
         self._random_state = random_state
         self._cross_validations = []
+        self._fold_positions = []
     
     @property
     def nb_folds(self) -> int:
@@ -34,11 +37,23 @@ class CrossValidationStrategy():
     
     @property
     def cross_validations(self) -> list:
+        if len(self._cross_validations)!=len(self._fold_positions):
+            self._cross_validations = [self._generate_train_test(fold['train'], fold['test']) for fold in self._fold_positions]
         return self._cross_validations
     
+    @property
+    def fold_positions(self) -> list:
+        return self._fold_positions
+    
+    def _add_fold_positions(self, train_index, test_index):
+        dict_train_test = dict()
+        dict_train_test['train'] = np.asarray(train_index, dtype=np.int32)
+        dict_train_test['test'] = np.asarray(test_index, dtype=np.int32)
+        self._fold_positions.append(dict_train_test)
+    
     def _generate_train_test(self, train_index, test_index) -> dict:
-        test_samples = list(self._data.iloc[test_index].index)
-        train_samples = list(self._data.iloc[train_index].index)
+        test_samples = list(self._data.index[test_index])
+        train_samples = list(self._data.index[train_index])
         dict_train_test = dict()
         dict_train_test['train'] = train_samples
         dict_train_test['test'] = test_samples
@@ -56,10 +71,11 @@ class KFoldStrategy(CrossValidationStrategy):
     
     def generate_cross_validations(self):
         self._cross_validations.clear()
+        self._fold_positions.clear()
+        from sklearn.model_selection import RepeatedKFold
         cv = RepeatedKFold(n_splits=self._nb_folds, n_repeats=self._nb_cross_validations, random_state=self._random_state)
         for train_index, test_index in cv.split(self._data):
-            dict_train_test = self._generate_train_test(train_index, test_index)
-            self._cross_validations.append(dict_train_test)
+            self._add_fold_positions(train_index, test_index)
 
 
     def __str__(self):
@@ -83,10 +99,67 @@ class StratifiedKFoldStrategy(CrossValidationStrategy):
         
     def generate_cross_validations(self):
         self._cross_validations.clear()
+        self._fold_positions.clear()
+        from sklearn.model_selection import RepeatedStratifiedKFold
         cv = RepeatedStratifiedKFold(n_splits=self._nb_folds, n_repeats=self._nb_cross_validations, random_state=self._random_state)
         for train_index, test_index in cv.split(self._data, self._targets):
-            dict_train_test = self._generate_train_test(train_index, test_index)
-            self._cross_validations.append(dict_train_test)
+            self._add_fold_positions(train_index, test_index)
             
     def __str__(self):
         return 'StratifiedKFoldStrategy'
+
+
+# === Fold subsets ===
+
+class FoldSubsetCache:
+    """Train and test subsets of every fold, resolved once.
+    
+    Survival arrays are aligned with each subset when the cache is built. The 
+    expression values of one feature, and their sorted copy, are extracted per 
+    subset the first time the feature is requested, so that quantiles become 
+    index arithmetic and fits never copy the expression matrix.
+    """
+    
+    _data: pd.DataFrame
+    _fold_positions: list
+    _survival_arrays: list # list of dict('train', 'test') of (time, event)
+    _feature = None
+    _feature_values: list # list of dict('train', 'test') of (values, sorted_values)
+    
+    def __init__(self, data: pd.DataFrame, time: np.ndarray, event: np.ndarray, fold_positions: list):
+        self._data = data
+        self._fold_positions = fold_positions
+        self._survival_arrays = [
+            {dataset: (time[fold[dataset]], event[fold[dataset]]) for dataset in ['train', 'test']} 
+            for fold in fold_positions
+            ]
+        self._feature = None
+        self._feature_values = []
+    
+    def __len__(self) -> int:
+        return len(self._fold_positions)
+    
+    def _load_feature(self, feature):
+        if feature==self._feature:
+            return
+        column = self._data[feature].to_numpy(dtype=float)
+        self._feature_values = []
+        for fold in self._fold_positions:
+            dict_values = dict()
+            for dataset in ['train', 'test']:
+                values = column[fold[dataset]]
+                dict_values[dataset] = (values, np.sort(values[~np.isnan(values)]))
+            self._feature_values.append(dict_values)
+        self._feature = feature
+    
+    def get_survival_arrays(self, ind_cv: int, dataset: str) -> tuple:
+        return self._survival_arrays[ind_cv][dataset]
+    
+    def get_values(self, feature, ind_cv: int, dataset: str) -> np.ndarray:
+        self._load_feature(feature)
+        return self._feature_values[ind_cv][dataset][0]
+    
+    def get_quantile(self, feature, ind_cv: int, dataset: str, quantile: float) -> float:
+        """Same value as data.loc[samples, feature].quantile(quantile)"""
+        self._load_feature(feature)
+        return sorted_percentile(self._feature_values[ind_cv][dataset][1], quantile * 100.0)
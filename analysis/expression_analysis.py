@@ -1,12 +1,120 @@
+import numpy as np
 import pandas as pd
+from analysis.sorted_index import SortedIndex
+
+
+_BIT_COUNTS = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8) # set bits of each byte value
+
+def _count_bits(packed: np.ndarray) -> np.ndarray:
+    """Set bits of each byte, without unpacking"""
+    if hasattr(np, 'bitwise_count'): # numpy >= 2
+        return np.bitwise_count(packed)
+    return _BIT_COUNTS[packed]
+
+
+class ExpressedSamples:
+    """Expressed-sample masks of several thresholds, bit-packed along the samples.
+
+    Masks are stored as a thresholds x features x ceil(samples/8) uint8 array,
+    1/8 of the memory of the boolean frames they replace.
+    """
+
+    _packed: np.ndarray
+    _samples: pd.Index
+    _features: pd.Index
+    _thresholds: pd.Index
+
+    def __init__(self, packed: np.ndarray, samples: pd.Index, features: pd.Index, thresholds: pd.Index):
+        self._packed = packed
+        self._samples = samples
+        self._features = features
+        self._thresholds = thresholds
+
+    @property
+    def packed(self) -> np.ndarray:
+        return self._packed
+
+    @property
+    def samples(self) -> pd.Index:
+        return self._samples
+
+    @property
+    def features(self) -> pd.Index:
+        return self._features
+
+    @property
+    def thresholds(self) -> pd.Index:
+        return self._thresholds
+
+    def get_expressed_samples(self, threshold) -> pd.DataFrame:
+        """Boolean samples x features frame of one threshold, as define_expressed_samples returns it"""
+        packed = self._packed[self._thresholds.get_loc(threshold)]
+        expressed = np.unpackbits(packed, axis=1, count=len(self._samples)).astype(bool)
+        return pd.DataFrame(expressed.T, index=self._samples, columns=self._features)
+
+    def count_expressed(self) -> pd.DataFrame:
+        """Number of expressed samples, features x thresholds, counted on the packed bytes"""
+        counts = _count_bits(self._packed).sum(axis=2, dtype=np.int64)
+        return pd.DataFrame(counts.T, index=self._features, columns=self._thresholds)
+
+    def count_coactivation(self, threshold, chunk_size: int = 4096) -> pd.DataFrame:
+        """Number of samples in which both features are expressed, features x features.
+
+        Samples are unpacked chunk_size at a time and counted with a matrix product.
+        """
+        packed = self._packed[self._thresholds.get_loc(threshold)]
+        nb_bytes = max(chunk_size // 8, 1)
+        counts = np.zeros((len(self._features), len(self._features)), dtype=np.int64)
+        for start in range(0, packed.shape[1], nb_bytes):
+            expressed = np.unpackbits(packed[:, start:start + nb_bytes], axis=1).astype(np.float32)
+            counts = counts + np.rint(expressed @ expressed.T).astype(np.int64)
+        return pd.DataFrame(counts, index=self._features, columns=self._features)
+
 
 class ExpressionFrequency:
-    
+
     def define_expressed_samples(self, data: pd.Series, threshold: pd.Series) -> pd.DataFrame:
         return data > threshold
-    
+
     def calculate_expression_frequency(self, data: pd.Series, threshold: pd.Series):
         expressed = self.define_expressed_samples(data, threshold)
         return 100.0 * expressed.sum() / expressed.shape[0]
 
-        
\ No newline at end of file
+    def _stack_thresholds(self, data: pd.DataFrame, thresholds) -> pd.DataFrame:
+        """Thresholds as a features x thresholds frame aligned with data, from a frame or a dict of Series"""
+        if isinstance(thresholds, dict):
+            thresholds = pd.DataFrame(thresholds)
+        return thresholds.reindex(data.columns).astype(float)
+
+    def calculate_expression_frequencies(self, data: pd.DataFrame, thresholds, sorted_index: SortedIndex = None) -> pd.DataFrame:
+        """Expression frequency in percentage for a stack of thresholds, features x thresholds.
+
+        Same values as calculate_expression_frequency for each threshold, counted
+        by binary search in the sorted columns of data instead of comparing every
+        sample. A sorted_index of data can be shared between calls.
+        """
+        thresholds = self._stack_thresholds(data, thresholds)
+        if sorted_index is None:
+            sorted_index = SortedIndex(data)
+        if data.shape[0]==0:
+            return pd.DataFrame(np.nan, index=thresholds.index, columns=thresholds.columns)
+        counts = sorted_index.count_greater(thresholds.to_numpy())
+        return pd.DataFrame(100.0 * counts / data.shape[0], index=thresholds.index, columns=thresholds.columns)
+
+    def define_packed_expressed_samples(self, data: pd.DataFrame, thresholds, chunk_size: int = 256) -> ExpressedSamples:
+        """Bit-packed expressed-sample masks of a stack of thresholds.
+
+        Features are read chunk_size at a time in their own dtype, so that a float32
+        memory map is never copied whole as float64.
+        """
+        thresholds = self._stack_thresholds(data, thresholds)
+        threshold_values = thresholds.to_numpy()
+        packed = np.empty((thresholds.shape[1], data.shape[1], (data.shape[0] + 7) // 8), dtype=np.uint8)
+        for start in range(0, data.shape[1], chunk_size):
+            values = data.iloc[:, start:start + chunk_size].to_numpy()
+            if not np.issubdtype(values.dtype, np.number):
+                values = values.astype(float)
+            values = values.T
+            for i in range(thresholds.shape[1]):
+                packed[i, start:start + values.shape[0]] = np.packbits(values > threshold_values[start:start + values.shape[0], i, None], axis=1)
+        return ExpressedSamples(packed, data.index, data.columns, thresholds.columns)
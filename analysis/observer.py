@@ -0,0 +1,73 @@
+import logging
+import pandas as pd
+
+
+class ThresholdObserver:
+    """Progress and instrumentation hooks of AdaptiveThreshold.calculate_threshold.
+
+    Every hook does nothing; subclasses override the ones they need. Hooks are
+    called in the main process, also when features are processed in a pool.
+    Statistics are dicts of counters: CV fits, skipped fits, pruned candidates,
+    early stops, survival models fitted, failed convergences, cache hits/misses and
+    the pre-screen report (features pruned, seconds spent and estimated seconds saved).
+    """
+
+    def on_run_start(self, nb_features: int, nb_checkpoints: int):
+        """Before processing, with the number of eligible features (those passing the pre-screen, if any) and of those loaded from checkpoints"""
+        pass
+
+    def on_stage(self, stage: str, seconds: float):
+        """After a run-level stage (threshold generation, pre-screen, checkpoint loading)"""
+        pass
+
+    def on_feature(self, feature, timings: dict, statistics: dict, details: pd.DataFrame):
+        """After a feature, with the seconds spent in each of its stages and its own counters"""
+        pass
+
+    def on_run_end(self, seconds: float, statistics: dict):
+        """After all features, with the counters of the whole run"""
+        pass
+
+
+class LoggingObserver(ThresholdObserver):
+    """Observer writing progress and timings to a logger ('ectopy' by default)"""
+
+    _logger: logging.Logger
+    _level: int
+    _nb_features: int
+    _nb_processed: int
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self._logger = logging.getLogger('ectopy') if logger is None else logger
+        self._level = level
+        self._nb_features = 0
+        self._nb_processed = 0
+
+    def on_run_start(self, nb_features: int, nb_checkpoints: int):
+        self._nb_features = nb_features - nb_checkpoints
+        self._nb_processed = 0
+        self._logger.log(self._level, 'Adaptive threshold of %d features, %d loaded from checkpoints', nb_features, nb_checkpoints)
+
+    def on_stage(self, stage: str, seconds: float):
+        self._logger.log(self._level, 'Stage %s done in %.3f s', stage, seconds)
+
+    def on_feature(self, feature, timings: dict, statistics: dict, details: pd.DataFrame):
+        self._nb_processed = self._nb_processed + 1
+        if not self._logger.isEnabledFor(self._level):
+            return
+        optimal = details[details['optimal']]
+        optimal_threshold = optimal.iloc[0]['threshold'] if optimal.shape[0]>0 else float('nan')
+        self._logger.log(
+            self._level, 'Feature %s (%d/%d): optimal threshold %.4g in %.3f s [%s] %s',
+            feature, self._nb_processed, self._nb_features, optimal_threshold, sum(timings.values()),
+            self._format_timings(timings), self._format_statistics(statistics)
+            )
+
+    def on_run_end(self, seconds: float, statistics: dict):
+        self._logger.log(self._level, 'Adaptive threshold done in %.3f s %s', seconds, self._format_statistics(statistics))
+
+    def _format_timings(self, timings: dict) -> str:
+        return ', '.join('%s %.3f s' % (stage, seconds) for stage, seconds in timings.items())
+
+    def _format_statistics(self, statistics: dict) -> str:
+        return ' '.join(('%s=%.3f' if isinstance(value, float) else '%s=%d') % (key, value) for key, value in statistics.items() if value)
@@ -0,0 +1,78 @@
+import numpy as np
+from analysis.survival import RiskSet, logrank_statistics
+
+
+def logrank_chi2(groups: np.ndarray, time: np.ndarray, event: np.ndarray, risk_set: RiskSet = None) -> np.ndarray:
+    """Log-rank chi-square statistic of every column of a binary group matrix, NaN when degenerate"""
+    observed_minus_expected, variance = logrank_statistics(groups, time, event, risk_set)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chi2 = observed_minus_expected**2 / variance
+    return np.where(variance>0, chi2, np.nan)
+
+
+class MaxStatisticPermutationTest:
+    """Permutation test of a grid of cut points, corrected for the choice of the best cut.
+
+    Survival labels are shuffled across samples, which amounts to permuting the
+    rows of the group matrix. For each permutation the log-rank chi-square of every
+    column is computed with array operations and the maximum over the grid is kept.
+    The adjusted p-value of a column is the single-step max-statistic p-value
+    (1 + #{permutations with max >= its statistic}) / (1 + nb_permutations).
+
+    Permutations are evaluated in batches of at most max_batch_size samples x columns
+    x permutations, which bounds memory whatever the number of permutations.
+    """
+
+    _nb_permutations: int
+    _max_batch_size: int
+    _rng: np.random.Generator
+
+    def __init__(self, nb_permutations: int = 1000, max_batch_size: int = 2**22, random_state = None):
+        self._nb_permutations = nb_permutations
+        self._max_batch_size = max_batch_size
+        self._rng = np.random.default_rng(random_state)
+
+    @property
+    def nb_permutations(self) -> int:
+        return self._nb_permutations
+
+    def get_batch_size(self, nb_samples: int, nb_columns: int) -> int:
+        """Number of permutations evaluated together"""
+        return int(max(1, min(self._nb_permutations, self._max_batch_size // max(1, nb_samples * nb_columns))))
+
+    def calculate_max_statistics(self, groups: np.ndarray, time: np.ndarray, event: np.ndarray) -> np.ndarray:
+        """Maximum log-rank chi-square over the columns for each permutation of the samples"""
+        nb_samples, nb_columns = groups.shape
+        batch_size = self.get_batch_size(nb_samples, nb_columns)
+        max_statistics = np.empty(self._nb_permutations)
+        risk_set = RiskSet(time, event) # shared by all permutations, only the groups are permuted
+        for start in range(0, self._nb_permutations, batch_size):
+            nb_batch = min(batch_size, self._nb_permutations - start)
+            permutations = self._rng.permuted(np.tile(np.arange(nb_samples), (nb_batch, 1)), axis=1)
+            # samples x (permutation, column) matrix of the permuted groups
+            permuted_groups = groups[permutations].transpose(1, 0, 2).reshape(nb_samples, nb_batch * nb_columns)
+            chi2 = logrank_chi2(permuted_groups, time, event, risk_set).reshape(nb_batch, nb_columns)
+            max_statistics[start:start + nb_batch] = np.where(np.isnan(chi2), -np.inf, chi2).max(axis=1)
+        return max_statistics
+
+    def calculate_adjusted_p_values(self, groups: np.ndarray, time: np.ndarray, event: np.ndarray) -> np.ndarray:
+        """Max-statistic adjusted p-value of each column, NaN for degenerate columns"""
+        statistics = logrank_chi2(groups, time, event)
+        if self._nb_permutations<1:
+            return np.full(len(statistics), np.nan)
+        max_statistics = self.calculate_max_statistics(groups, time, event)
+        # relative tolerance so that a permutation reproducing the observed groups counts as exceeding
+        exceeding = max_statistics[:, None]>=statistics[None, :] * (1.0 - 1e-10)
+        p_values = (1.0 + exceeding.sum(axis=0)) / (1.0 + self._nb_permutations)
+        return np.where(np.isnan(statistics), np.nan, p_values)
+
+
+def adjust_p_values_fdr(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values; NaN p-values stay NaN and are not counted as tests"""
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full(len(p_values), np.nan)
+    tested = np.flatnonzero(~np.isnan(p_values))
+    order = tested[np.argsort(p_values[tested], kind='mergesort')]
+    ranked = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    adjusted[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return adjusted
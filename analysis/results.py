@@ -0,0 +1,121 @@
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+
+class ThresholdResults:
+    """Candidate thresholds of every feature in one long-format table of typed arrays.
+
+    The rows of a feature are contiguous and in threshold order, located through
+    an offset array, so that a feature column is a numpy view written in place.
+    Float columns start as NaN and bool columns as False. get_details gives the
+    per-feature frame (thresholds indexed 'T1'...'Tn'), to_frame the whole table
+    with a categorical feature column and the threshold number.
+    """
+
+    _features: pd.Index
+    _positions: dict # {feature: position in features}
+    _offsets: np.ndarray # rows of the feature at position i are offsets[i]:offsets[i+1]
+    _columns: dict # {name: np.ndarray}, in column order
+
+    def __init__(self, features: list, nb_thresholds: list, columns: dict):
+        """columns maps each column name to its numpy dtype"""
+        self._features = pd.Index(features)
+        self._positions = {feature: position for position, feature in enumerate(self._features)}
+        self._offsets = np.concatenate([[0], np.cumsum(np.asarray(nb_thresholds, dtype=np.int64))]).astype(np.int64)
+        nb_rows = int(self._offsets[-1])
+        self._columns = dict()
+        for name, dtype in columns.items():
+            dtype = np.dtype(dtype)
+            self._columns[name] = np.full(nb_rows, np.nan, dtype=dtype) if dtype.kind=='f' else np.zeros(nb_rows, dtype=dtype)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> 'ThresholdResults':
+        """Results of a to_frame table whose rows are grouped by feature in threshold order"""
+        features = list(dict.fromkeys(frame['feature']))
+        nb_thresholds = frame.groupby('feature', sort=False, observed=True).size().reindex(features).to_numpy()
+        data_columns = [name for name in frame.columns if name not in ('feature', 'threshold_number')]
+        results = cls(features, nb_thresholds, {name: frame[name].dtype for name in data_columns})
+        for name in data_columns:
+            results._columns[name][:] = frame[name].to_numpy()
+        return results
+
+    @property
+    def features(self) -> pd.Index:
+        return self._features
+
+    @property
+    def columns(self) -> list:
+        return list(self._columns)
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def __contains__(self, feature) -> bool:
+        return feature in self._positions
+
+    def get_rows(self, feature) -> slice:
+        position = self._positions[feature]
+        return slice(int(self._offsets[position]), int(self._offsets[position + 1]))
+
+    def get_nb_thresholds(self, feature) -> int:
+        rows = self.get_rows(feature)
+        return rows.stop - rows.start
+
+    def get_column(self, feature, column: str) -> np.ndarray:
+        """Writable view of a column over the rows of a feature"""
+        return self._columns[column][self.get_rows(feature)]
+
+    def get_details(self, feature) -> pd.DataFrame:
+        """Copy of the rows of a feature, indexed 'T1'...'Tn'"""
+        rows = self.get_rows(feature)
+        index = ['T' + str(i+1) for i in range(rows.stop - rows.start)]
+        return pd.DataFrame({name: values[rows].copy() for name, values in self._columns.items()}, index=index)
+
+    def set_details(self, feature, details: pd.DataFrame):
+        rows = self.get_rows(feature)
+        if details.shape[0]!=rows.stop - rows.start:
+            raise ValueError('Details of ' + str(feature) + ' have ' + str(details.shape[0]) + ' thresholds instead of ' + str(rows.stop - rows.start))
+        for name, values in self._columns.items():
+            values[rows] = details[name].to_numpy(dtype=values.dtype)
+
+    def get_optimal_thresholds(self) -> pd.Series:
+        """Threshold of the optimal row of each feature having one"""
+        rows = np.flatnonzero(self._columns['optimal'])
+        positions = np.searchsorted(self._offsets, rows, side='right') - 1
+        return pd.Series(self._columns['threshold'][rows], index=self._features[positions])
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long-format table: feature (categorical), threshold_number (from 1) and the columns"""
+        nb_thresholds = np.diff(self._offsets)
+        codes = np.repeat(np.arange(len(self._features), dtype=np.int32), nb_thresholds)
+        threshold_number = np.arange(len(self), dtype=np.int32) - np.repeat(self._offsets[:-1], nb_thresholds).astype(np.int32) + 1
+        frame = {'feature': pd.Categorical.from_codes(codes, categories=self._features), 'threshold_number': threshold_number}
+        frame.update(self._columns)
+        return pd.DataFrame(frame)
+
+    def to_parquet(self, path: str, **kwargs):
+        """Parquet export of to_frame (needs pyarrow or fastparquet)"""
+        self.to_frame().to_parquet(path, index=False, **kwargs)
+
+    def to_feather(self, path: str, **kwargs):
+        """Feather export of to_frame (needs pyarrow)"""
+        self.to_frame().to_feather(path, **kwargs)
+
+
+class ThresholdDetails(Mapping):
+    """Read-only {feature: details} view of ThresholdResults, each frame built when it is looked up"""
+
+    _results: ThresholdResults
+
+    def __init__(self, results: ThresholdResults):
+        self._results = results
+
+    def __getitem__(self, feature) -> pd.DataFrame:
+        return self._results.get_details(feature)
+
+    def __iter__(self):
+        return iter(self._results.features)
+
+    def __len__(self) -> int:
+        return len(self._results.features)
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def _take(sorted_values: np.ndarray, indexes: np.ndarray) -> np.ndarray:
+    if sorted_values.ndim==1:
+        return sorted_values[indexes]
+    return sorted_values[indexes, np.arange(sorted_values.shape[1])]
+
+
+def _interpolate_sorted(sorted_values: np.ndarray, nb_values, quantiles: np.ndarray) -> np.ndarray:
+    """Linear interpolation of np.percentile on the nb_values first (sorted) rows"""
+    virtual_indexes = (nb_values - 1) * quantiles
+    previous_indexes = np.floor(virtual_indexes)
+    next_indexes = previous_indexes + 1
+    above_bounds = virtual_indexes>=nb_values - 1
+    previous_indexes = np.where(above_bounds, nb_values - 1, previous_indexes)
+    next_indexes = np.where(above_bounds, nb_values - 1, next_indexes)
+    below_bounds = virtual_indexes<0
+    previous_indexes = np.where(below_bounds, 0, previous_indexes).astype(np.intp)
+    next_indexes = np.where(below_bounds, 0, next_indexes).astype(np.intp)
+    gamma = virtual_indexes - np.floor(virtual_indexes)
+    previous_values = _take(sorted_values, previous_indexes)
+    next_values = _take(sorted_values, next_indexes)
+    diff = next_values - previous_values
+    interpolation = previous_values + diff * gamma
+    interpolation = np.where(gamma>=0.5, next_values - diff * (1 - gamma), interpolation)
+    return np.where(nb_values>0, interpolation, np.nan)
+
+
+def sorted_percentile(sorted_values: np.ndarray, percentiles) -> np.ndarray:
+    """Percentiles of already sorted values without NaN, by index arithmetic.
+
+    Reproduces the 'linear' method of np.percentile (and therefore of pandas
+    quantile, which calls it with 100 * q) bit for bit, without partitioning.
+    """
+    shape = np.shape(percentiles)
+    quantiles = np.true_divide(np.atleast_1d(np.asarray(percentiles, dtype=float)), 100)
+    if len(sorted_values)==0:
+        return np.full(shape, np.nan)[()]
+    return _interpolate_sorted(sorted_values, len(sorted_values), quantiles).reshape(shape)[()]
+
+
+def _count_less_equal(sorted_values: np.ndarray, nb_valid: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """Binary search of thresholds (columns or columns x k) in the sorted columns"""
+    columns = np.arange(sorted_values.shape[1]).reshape((-1,) + (1,) * (thresholds.ndim - 1))
+    lower = np.zeros(thresholds.shape, dtype=np.intp)
+    upper = np.broadcast_to(nb_valid.astype(np.intp).reshape(columns.shape), thresholds.shape)
+    active = lower<upper
+    while np.any(active):
+        middle = (lower + upper) // 2
+        below = sorted_values[np.minimum(middle, sorted_values.shape[0] - 1), columns]<=thresholds
+        lower = np.where(active & below, middle + 1, lower)
+        upper = np.where(active & ~below, middle, upper)
+        active = lower<upper
+    return lower
+
+
+class SortedIndex:
+    """Sorted values of the columns of a DataFrame, sorted by blocks of columns on first use.
+
+    NaN are sorted last, as pandas does. Columns are read and sorted block_size at
+    a time, and the sorted blocks are kept in an LRU cache of at most cache_size
+    values. The sorted copy never exceeds that size, even when the data is a
+    memory map larger than RAM; whole-frame queries go through the blocks in turn.
+    Percentile-of-value lookups are binary searches run on all columns of a block
+    at once; n-th sample and percentile lookups are index arithmetic. Results match
+    the pandas/numpy computations they replace.
+    """
+
+    _data: pd.DataFrame
+    _columns: pd.Index
+    _block_size: int
+    _max_cached_blocks: int
+    _blocks: OrderedDict # {block number: (rows x block columns sorted along rows, number of non-NaN values per column)}
+
+    def __init__(self, data: pd.DataFrame, block_size: int = 256, cache_size: int = 2**25):
+        self._data = data
+        self._columns = data.columns
+        self._block_size = block_size
+        self._max_cached_blocks = max(1, cache_size // max(1, data.shape[0] * block_size))
+        self._blocks = OrderedDict()
+
+    @property
+    def columns(self) -> pd.Index:
+        return self._columns
+
+    @property
+    def nb_rows(self) -> int:
+        return self._data.shape[0]
+
+    @property
+    def nb_cached_values(self) -> int:
+        """Size of the sorted blocks held in the cache"""
+        return sum(sorted_values.size for sorted_values, _ in self._blocks.values())
+
+    def _get_block(self, ind_block: int) -> tuple:
+        if ind_block in self._blocks:
+            self._blocks.move_to_end(ind_block)
+            return self._blocks[ind_block]
+        start = ind_block * self._block_size
+        values = self._data.iloc[:, start:start + self._block_size].to_numpy()
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(float)
+        sorted_values = np.sort(values, axis=0)
+        block = (sorted_values, np.count_nonzero(~np.isnan(sorted_values), axis=0))
+        self._blocks[ind_block] = block
+        while len(self._blocks)>self._max_cached_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def _iter_blocks(self):
+        """(columns slice, sorted values, nb_valid) of each block of columns in turn"""
+        for start in range(0, len(self._columns), self._block_size):
+            sorted_values, nb_valid = self._get_block(start // self._block_size)
+            yield slice(start, start + sorted_values.shape[1]), sorted_values, nb_valid
+
+    def get_sorted_values(self, column) -> np.ndarray:
+        """Sorted non-NaN values of a column (a view)"""
+        ind_column = self._columns.get_loc(column)
+        sorted_values, nb_valid = self._get_block(ind_column // self._block_size)
+        ind_column = ind_column % self._block_size
+        return sorted_values[:nb_valid[ind_column], ind_column]
+
+    def count_less_equal(self, thresholds) -> np.ndarray:
+        """Number of values <= threshold in each column.
+
+        thresholds is aligned with the columns, either one value per column or
+        a columns x k stack searched in the same pass.
+        """
+        thresholds = np.asarray(thresholds, dtype=float)
+        counts = np.zeros(thresholds.shape, dtype=np.intp)
+        for columns, sorted_values, nb_valid in self._iter_blocks():
+            counts[columns] = _count_less_equal(sorted_values, nb_valid, thresholds[columns])
+        return counts
+
+    def count_greater(self, thresholds) -> np.ndarray:
+        """Number of values > threshold in each column, as data > threshold counts them (none for a NaN threshold)"""
+        thresholds = np.asarray(thresholds, dtype=float)
+        counts = np.zeros(thresholds.shape, dtype=np.intp)
+        for columns, sorted_values, nb_valid in self._iter_blocks():
+            block_thresholds = thresholds[columns]
+            block_nb_valid = nb_valid.reshape((-1,) + (1,) * (thresholds.ndim - 1))
+            counts[columns] = np.where(np.isnan(block_thresholds), 0, block_nb_valid - _count_less_equal(sorted_values, nb_valid, block_thresholds))
+        return counts
+
+    def percentile_of(self, thresholds: pd.Series, columns=None) -> pd.Series:
+        """Percentage of values <= threshold, counting NaN in the total (0 for a NaN threshold).
+
+        Computed for each column, or only for the given columns, whose blocks alone are sorted.
+        """
+        if columns is None:
+            thresholds = thresholds.reindex(self._columns)
+            if self.nb_rows==0:
+                return pd.Series(0.0, index=self._columns)
+            return pd.Series(100.0 * self.count_less_equal(thresholds.to_numpy()) / self.nb_rows, index=self._columns)
+        columns = pd.Index(columns)
+        thresholds = thresholds.reindex(columns).to_numpy(dtype=float)
+        if self.nb_rows==0:
+            return pd.Series(0.0, index=columns)
+        counts = np.zeros(len(columns))
+        for i, (column, threshold) in enumerate(zip(columns, thresholds)):
+            if not np.isnan(threshold):
+                counts[i] = np.searchsorted(self.get_sorted_values(column), threshold, side='right')
+        return pd.Series(100.0 * counts / self.nb_rows, index=columns)
+
+    def nth_value(self, nb_samples: int, ascending: bool = True) -> pd.Series:
+        """Value of the nb_samples-th sample in each sorted column, NaN last in both directions"""
+        if nb_samples<1 or self.nb_rows==0:
+            return pd.Series(np.nan, index=self._columns)
+        position = min(nb_samples, self.nb_rows) - 1
+        values = np.empty(len(self._columns))
+        for columns, sorted_values, nb_valid in self._iter_blocks():
+            block_columns = np.arange(sorted_values.shape[1])
+            if ascending:
+                values[columns] = sorted_values[position, block_columns]
+            else:
+                valid = position<nb_valid
+                block_values = sorted_values[np.where(valid, nb_valid - 1 - position, 0), block_columns]
+                values[columns] = np.where(valid, block_values, np.nan)
+        return pd.Series(values, index=self._columns)
+
+    def quantile(self, quantile: float) -> pd.Series:
+        """Same as DataFrame.quantile(quantile) on numeric columns"""
+        if self.nb_rows==0:
+            return pd.Series(np.nan, index=self._columns, name=quantile)
+        values = np.empty(len(self._columns))
+        for columns, sorted_values, nb_valid in self._iter_blocks():
+            quantiles = np.true_divide(np.full(sorted_values.shape[1], quantile * 100.0), 100)
+            values[columns] = _interpolate_sorted(sorted_values, nb_valid, quantiles)
+        return pd.Series(values, index=self._columns, name=quantile)
+
+    def max(self) -> pd.Series:
+        if self.nb_rows==0:
+            return pd.Series(np.nan, index=self._columns)
+        values = np.empty(len(self._columns))
+        for columns, sorted_values, nb_valid in self._iter_blocks():
+            block_values = sorted_values[np.maximum(nb_valid - 1, 0), np.arange(sorted_values.shape[1])]
+            values[columns] = np.where(nb_valid>0, block_values, np.nan)
+        return pd.Series(values, index=self._columns)
+
+    def percentiles(self, column, percentiles) -> np.ndarray:
+        """Same as np.percentile of the non-NaN values of a column, for an array of percentiles"""
+        return sorted_percentile(self.get_sorted_values(column), percentiles)
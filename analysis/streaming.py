@@ -0,0 +1,444 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+
+# === Running statistics ===
+
+class OnlineMoments:
+    """Count, mean and sum of squared deviations of each feature, NaN ignored.
+
+    Chunks are combined with the pairwise form of Welford's update (Chan et al.),
+    which is also how two partial states are merged, so chunks can be processed
+    in any order or in parallel.
+    """
+
+    _count: np.ndarray
+    _mean: np.ndarray
+    _m2: np.ndarray
+
+    def __init__(self, nb_features: int):
+        self._count = np.zeros(nb_features)
+        self._mean = np.zeros(nb_features)
+        self._m2 = np.zeros(nb_features)
+
+    @property
+    def count(self) -> np.ndarray:
+        return self._count
+
+    @property
+    def mean(self) -> np.ndarray:
+        return np.where(self._count>0, self._mean, np.nan)
+
+    def get_variance(self, ddof: int = 1) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self._count>ddof, self._m2 / (self._count - ddof), np.nan)
+
+    def update(self, values: np.ndarray):
+        """Add a samples x features chunk"""
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(valid, values, 0.0).sum(axis=0) / count
+        m2 = np.where(valid, values - mean, 0.0)
+        m2 = (m2 * m2).sum(axis=0)
+        self._combine(count, np.where(count>0, mean, 0.0), m2)
+
+    def merge(self, other: 'OnlineMoments'):
+        self._combine(other._count, other._mean, other._m2)
+
+    def _combine(self, count: np.ndarray, mean: np.ndarray, m2: np.ndarray):
+        total = self._count + count
+        delta = mean - self._mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(total>0, count / total, 0.0)
+        self._mean = self._mean + delta * weight
+        self._m2 = self._m2 + m2 + delta * delta * self._count * weight
+        self._count = total
+
+
+class HistogramSketch:
+    """Fixed-range histogram of each feature, a bounded-memory quantile sketch.
+
+    Values are counted in nb_bins equal bins over [lower, upper], one range shared
+    by all features or one per feature; values outside the range are counted in
+    the first or last bin, and in nb_clamped. The exact minimum and maximum are
+    kept as well. Memory is nb_features x nb_bins counts whatever the number of
+    samples, and sketches of the same ranges merge by adding their counts.
+
+    Quantiles follow the linear method of np.percentile: the two order statistics
+    around the target rank are each placed in the bin holding them, evenly spread
+    over the values of that bin, then interpolated. When all values lie in
+    [lower, upper], each order statistic is off by less than one bin width, so the
+    quantile error is at most one bin width (upper - lower) / nb_bins of the feature.
+    """
+
+    _lower: np.ndarray
+    _upper: np.ndarray
+    _nb_bins: int
+    _counts: np.ndarray # features x bins
+    _nb_clamped: np.ndarray
+    _min: np.ndarray
+    _max: np.ndarray
+
+    def __init__(self, nb_features: int, lower, upper, nb_bins: int = 1000):
+        self._lower = np.broadcast_to(np.asarray(lower, dtype=float), (nb_features,))
+        self._upper = np.broadcast_to(np.asarray(upper, dtype=float), (nb_features,))
+        if not np.all(self._upper>self._lower):
+            raise ValueError('Empty histogram range: ' + str((lower, upper)))
+        self._nb_bins = nb_bins
+        self._counts = np.zeros((nb_features, nb_bins), dtype=np.int64)
+        self._nb_clamped = np.zeros(nb_features, dtype=np.int64)
+        self._min = np.full(nb_features, np.inf)
+        self._max = np.full(nb_features, -np.inf)
+
+    @property
+    def bin_width(self) -> np.ndarray:
+        return (self._upper - self._lower) / self._nb_bins
+
+    @property
+    def nb_clamped(self) -> np.ndarray:
+        """Number of values of each feature outside its range, whose quantiles lose the error bound"""
+        return self._nb_clamped
+
+    @property
+    def max(self) -> np.ndarray:
+        return np.where(np.isfinite(self._max), self._max, np.nan)
+
+    @property
+    def min(self) -> np.ndarray:
+        return np.where(np.isfinite(self._min), self._min, np.nan)
+
+    def update(self, values: np.ndarray):
+        """Add a samples x features chunk"""
+        valid = ~np.isnan(values)
+        bins = np.floor((np.where(valid, values, self._lower) - self._lower) / self.bin_width)
+        self._nb_clamped += np.count_nonzero(valid & ((bins<0) | (values>self._upper)), axis=0)
+        bins = np.clip(bins, 0, self._nb_bins - 1).astype(np.intp)
+        features = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+        np.add.at(self._counts, (features[valid], bins[valid]), 1)
+        self._min = np.fmin(self._min, np.where(valid, values, np.inf).min(axis=0, initial=np.inf))
+        self._max = np.fmax(self._max, np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf))
+
+    def merge(self, other: 'HistogramSketch'):
+        if other._nb_bins!=self._nb_bins or not (np.array_equal(other._lower, self._lower) and np.array_equal(other._upper, self._upper)):
+            raise ValueError('Histogram sketches with different bins cannot be merged')
+        self._counts += other._counts
+        self._nb_clamped += other._nb_clamped
+        self._min = np.fmin(self._min, other._min)
+        self._max = np.fmax(self._max, other._max)
+
+    def _get_order_statistic(self, cumulative: np.ndarray, rank: np.ndarray) -> np.ndarray:
+        """Estimate of the value of 0-based rank of each feature, inside the bin holding it"""
+        ind_bin = np.minimum((cumulative<=rank[:, None]).sum(axis=1), self._nb_bins - 1)
+        features = np.arange(len(rank))
+        in_bin = self._counts[features, ind_bin]
+        before = cumulative[features, ind_bin] - in_bin
+        with np.errstate(divide='ignore', invalid='ignore'):
+            position = np.where(in_bin>0, (rank - before + 0.5) / in_bin, 0.5)
+        estimate = self._lower + (ind_bin + np.clip(position, 0.0, 1.0)) * self.bin_width
+        return np.clip(estimate, self._min, self._max)
+
+    def quantile(self, quantile: float) -> np.ndarray:
+        count = self._counts.sum(axis=1)
+        cumulative = np.cumsum(self._counts, axis=1)
+        rank = quantile * np.maximum(count - 1, 0)
+        rank_below = np.floor(rank)
+        rank_above = np.minimum(rank_below + 1, np.maximum(count - 1, 0))
+        fraction = rank - rank_below
+        estimate = (1 - fraction) * self._get_order_statistic(cumulative, rank_below) + fraction * self._get_order_statistic(cumulative, rank_above)
+        return np.where(count>0, estimate, np.nan)
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch of each feature with a bounded rank error (KLL compactors).
+
+    Values are kept in levels of at most about k items per feature, an item of level h
+    standing for 2**h values. A full level is sorted and every other item, from a random
+    start, moves to the level above, as in Karnin, Lang and Liberty (2016); lower levels
+    get capacities decreasing by 2/3. Memory is about 3 * k items per feature whatever
+    the number of samples and the scale of the values, and two sketches merge by
+    pooling their levels. NaN are sorted last and stay out of the quantiles.
+
+    The error is on ranks, not on values: the rank of an estimated quantile is off by
+    about 2 n / k of the n values (1% with k = 200), so that low-expressed features
+    are as precise as the others. Up to k values, quantiles are exact. The exact
+    minimum and maximum are kept as well.
+    """
+
+    _k: int
+    _levels: list # samples x features arrays, items of level h weighing 2**h
+    _min: np.ndarray
+    _max: np.ndarray
+    _rng: np.random.Generator
+
+    def __init__(self, nb_features: int, k: int = 200, random_state = None):
+        if k<2:
+            raise ValueError('Quantile sketch capacity must be at least 2: ' + str(k))
+        self._k = k
+        self._levels = [np.empty((0, nb_features))]
+        self._min = np.full(nb_features, np.inf)
+        self._max = np.full(nb_features, -np.inf)
+        self._rng = np.random.default_rng(random_state)
+
+    @property
+    def k(self) -> int:
+        return self._k
+
+    @property
+    def count(self) -> np.ndarray:
+        """Estimated number of non-NaN values of each feature"""
+        return sum((~np.isnan(level)).sum(axis=0) * 2**h for h, level in enumerate(self._levels))
+
+    @property
+    def nb_items(self) -> int:
+        """Items kept per feature"""
+        return sum(level.shape[0] for level in self._levels)
+
+    @property
+    def max(self) -> np.ndarray:
+        return np.where(np.isfinite(self._max), self._max, np.nan)
+
+    @property
+    def min(self) -> np.ndarray:
+        return np.where(np.isfinite(self._min), self._min, np.nan)
+
+    def _get_capacity(self, level: int) -> int:
+        return max(2, int(np.ceil(self._k * (2.0 / 3.0)**(len(self._levels) - 1 - level))))
+
+    def _compress(self):
+        h = 0
+        while h<len(self._levels):
+            level = self._levels[h]
+            if level.shape[0]<=self._get_capacity(h):
+                h = h + 1
+                continue
+            level = np.sort(level, axis=0)
+            nb_compacted = level.shape[0] - level.shape[0] % 2
+            if h==len(self._levels) - 1:
+                self._levels.append(np.empty((0, level.shape[1])))
+            promoted = level[self._rng.integers(2):nb_compacted:2]
+            self._levels[h] = level[nb_compacted:]
+            self._levels[h + 1] = np.concatenate([self._levels[h + 1], promoted])
+            h = 0 # capacities change when a level is added
+
+    def update(self, values: np.ndarray):
+        """Add a samples x features chunk"""
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        self._min = np.fmin(self._min, np.where(np.isnan(values), np.inf, values).min(axis=0, initial=np.inf))
+        self._max = np.fmax(self._max, np.where(np.isnan(values), -np.inf, values).max(axis=0, initial=-np.inf))
+
+    def merge(self, other: 'QuantileSketch'):
+        if other._k!=self._k:
+            raise ValueError('Quantile sketches with different capacities cannot be merged')
+        while len(self._levels)<len(other._levels):
+            self._levels.append(np.empty((0, self._min.shape[0])))
+        for h, level in enumerate(other._levels):
+            self._levels[h] = np.concatenate([self._levels[h], level])
+        self._compress()
+        self._min = np.fmin(self._min, other._min)
+        self._max = np.fmax(self._max, other._max)
+
+    def _get_order_statistic(self, items: np.ndarray, cumulative: np.ndarray, rank: np.ndarray) -> np.ndarray:
+        """Item holding the 0-based rank of each feature, items sorted and weights cumulated along the rows"""
+        if items.shape[0]==0:
+            return np.full(items.shape[1], np.nan)
+        ind_item = np.minimum((cumulative<=rank).sum(axis=0), items.shape[0] - 1)
+        return items[ind_item, np.arange(items.shape[1])]
+
+    def quantile(self, quantile: float) -> np.ndarray:
+        """Same linear method as np.percentile, on the weighted items of each feature"""
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(level.shape[0], 2.0**h) for h, level in enumerate(self._levels)])
+        order = np.argsort(items, axis=0)
+        items = np.take_along_axis(items, order, axis=0)
+        cumulative = np.cumsum(np.where(np.isnan(items), 0.0, weights[order]), axis=0)
+        count = cumulative[-1] if items.shape[0]>0 else np.zeros(items.shape[1])
+        rank = quantile * np.maximum(count - 1, 0)
+        rank_below = np.floor(rank)
+        rank_above = np.minimum(rank_below + 1, np.maximum(count - 1, 0))
+        fraction = rank - rank_below
+        estimate = (1 - fraction) * self._get_order_statistic(items, cumulative, rank_below) + fraction * self._get_order_statistic(items, cumulative, rank_above)
+        return np.where(count>0, np.clip(estimate, self._min, self._max), np.nan)
+
+
+# === Streaming thresholds ===
+
+class StreamingThreshold:
+    """Abstract threshold computed from chunks of samples.
+
+    partial_fit takes samples x features chunks; the first chunk sets the features,
+    later chunks may hold them in any order. States built on separate chunks
+    (e.g. in worker processes) are combined with merge.
+    """
+
+    _features: pd.Index = None
+
+    @property
+    def features(self) -> pd.Index:
+        return self._features
+
+    def partial_fit(self, data: pd.DataFrame) -> 'StreamingThreshold':
+        if self._features is None:
+            self._init_state(data.columns)
+        unknown = data.columns.difference(self._features)
+        if len(unknown)>0:
+            raise ValueError('Features not in the first chunk: ' + str(list(unknown)))
+        self._update(data.reindex(columns=self._features).to_numpy(dtype=float))
+        return self
+
+    def merge(self, other: 'StreamingThreshold') -> 'StreamingThreshold':
+        if other._features is None:
+            return self
+        if self._features is None:
+            self._init_state(other._features)
+        if not self._features.equals(other._features):
+            raise ValueError('Streaming thresholds with different features cannot be merged')
+        self._merge(other)
+        return self
+
+    def _init_state(self, features: pd.Index):
+        self._features = features
+
+    def _update(self, values: np.ndarray):
+        pass
+
+    def _merge(self, other: 'StreamingThreshold'):
+        pass
+
+    def calculate_threshold(self) -> pd.Series:
+        pass
+
+
+class StreamingMeanThreshold(StreamingThreshold):
+    """Streaming MeanTreshold"""
+
+    _moments: OnlineMoments
+
+    def _init_state(self, features: pd.Index):
+        super()._init_state(features)
+        self._moments = OnlineMoments(len(features))
+
+    def _update(self, values: np.ndarray):
+        self._moments.update(values)
+
+    def _merge(self, other: 'StreamingMeanThreshold'):
+        self._moments.merge(other._moments)
+
+    def calculate_threshold(self) -> pd.Series:
+        return pd.Series(self._moments.mean, index=self._features)
+
+
+class StreamingMaxThreshold(StreamingThreshold):
+    """Streaming MaxTreshold"""
+
+    _max: np.ndarray
+
+    def _init_state(self, features: pd.Index):
+        super()._init_state(features)
+        self._max = np.full(len(features), np.nan)
+
+    def _update(self, values: np.ndarray):
+        self._max = np.fmax(self._max, np.where(np.isnan(values), -np.inf, values).max(axis=0, initial=-np.inf))
+        self._max = np.where(np.isneginf(self._max), np.nan, self._max)
+
+    def _merge(self, other: 'StreamingMaxThreshold'):
+        self._max = np.fmax(self._max, other._max)
+
+    def calculate_threshold(self) -> pd.Series:
+        return pd.Series(self._max, index=self._features)
+
+
+class StreamingPercentileThreshold(StreamingThreshold):
+    """Streaming PercentileThreshold.
+
+    By default from a QuantileSketch of capacity k, whose rank error does not depend
+    on the scale of each feature. Given lower and upper, scalars or Series by feature,
+    from a HistogramSketch over [lower, upper] instead: the error is then at most
+    (upper - lower) / nb_bins for features whose values all lie in their range, and
+    calculate_threshold warns about the features that had values outside it.
+    """
+
+    _percentile: float
+    _lower = None
+    _upper = None
+    _nb_bins: int
+    _k: int
+    _random_state = None
+    _sketch = None # QuantileSketch or HistogramSketch
+
+    def __init__(self, percentile: float, lower = None, upper = None, nb_bins: int = 1000, k: int = 200, random_state = None):
+        if (lower is None)!=(upper is None):
+            raise ValueError('Histogram range needs both lower and upper: ' + str((lower, upper)))
+        self._percentile = percentile
+        self._lower = lower
+        self._upper = upper
+        self._nb_bins = nb_bins
+        self._k = k
+        self._random_state = random_state
+
+    def _get_range_bound(self, bound, features: pd.Index):
+        if isinstance(bound, pd.Series):
+            bound = bound.reindex(features).to_numpy(dtype=float)
+        return bound
+
+    def _init_state(self, features: pd.Index):
+        super()._init_state(features)
+        if self._lower is None:
+            self._sketch = QuantileSketch(len(features), self._k, self._random_state)
+        else:
+            self._sketch = HistogramSketch(len(features), self._get_range_bound(self._lower, features), self._get_range_bound(self._upper, features), self._nb_bins)
+
+    def _update(self, values: np.ndarray):
+        self._sketch.update(values)
+
+    def _merge(self, other: 'StreamingPercentileThreshold'):
+        if type(other._sketch) is not type(self._sketch):
+            raise ValueError('Streaming percentiles with different sketches cannot be merged')
+        self._sketch.merge(other._sketch)
+
+    def calculate_threshold(self) -> pd.Series:
+        if isinstance(self._sketch, HistogramSketch) and np.any(self._sketch.nb_clamped>0):
+            clamped = self._features[self._sketch.nb_clamped>0]
+            warnings.warn(str(len(clamped)) + ' features have values outside the histogram range, their percentiles are not bounded: ' + str(list(clamped[:10])))
+        return pd.Series(self._sketch.quantile(self._percentile/100.0), index=self._features, name=self._percentile/100.0)
+
+
+class StreamingStdDecorator(StreamingThreshold):
+    """Streaming StdDecorator: the decorated streaming threshold plus nb_std sample standard deviations"""
+
+    _threshold: StreamingThreshold
+    _nb_std: float
+    _moments: OnlineMoments
+
+    def __init__(self, threshold: StreamingThreshold, nb_std: float = 0.0):
+        self._threshold = threshold
+        self._nb_std = nb_std
+
+    @property
+    def threshold(self) -> StreamingThreshold:
+        return self._threshold
+
+    @property
+    def nb_std(self) -> float:
+        return self._nb_std
+
+    def _init_state(self, features: pd.Index):
+        super()._init_state(features)
+        self._moments = OnlineMoments(len(features))
+
+    def partial_fit(self, data: pd.DataFrame) -> 'StreamingStdDecorator':
+        self._threshold.partial_fit(data)
+        return super().partial_fit(data)
+
+    def _update(self, values: np.ndarray):
+        self._moments.update(values)
+
+    def _merge(self, other: 'StreamingStdDecorator'):
+        self._threshold.merge(other._threshold)
+        self._moments.merge(other._moments)
+
+    def calculate_threshold(self) -> pd.Series:
+        std = pd.Series(np.sqrt(self._moments.get_variance(ddof=1)), index=self._features)
+        return self._threshold.calculate_threshold() + self.nb_std * std
@@ -1,6 +1,14 @@
+import os
+import zlib
+import hashlib
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
-from analysis import cross_validation, survival
+from analysis import cross_validation, permutation, survival
+from analysis.observer import ThresholdObserver
+from analysis.results import ThresholdResults, ThresholdDetails
+from analysis.sorted_index import SortedIndex
 
 # === Thresholds ===
 
@@ -8,26 +16,38 @@ class Threshold:
     """Abstract threshold class"""
     
     _data: pd.DataFrame
+    _sorted_index: SortedIndex = None
     
-    def __init__(self, data: pd.DataFrame):
+    def __init__(self, data: pd.DataFrame, sorted_index: SortedIndex = None):
         self._data = data
+        self._sorted_index = sorted_index
     
     @property
     def data(self) -> pd.DataFrame:
         return self._data
     
+    @property
+    def sorted_index(self) -> SortedIndex:
+        """Sorted columns of data, built on first use and shareable between thresholds"""
+        if self._sorted_index is None:
+            self._sorted_index = SortedIndex(self.data)
+        return self._sorted_index
+    
     def calculate_threshold(self) -> pd.Series:
         pass
     
-    def get_threshold_percentile(self, expression_values: pd.Series, threshold: float) -> float:
-        values = expression_values.sort_values().to_numpy()
-        if (len(values)==0.0):
-            return 0.0
-        n = 0
-        for i in range(len(values)):
-            if (values[i]<=threshold):
-                n = n + 1
-        return 100.0 * n / len(values)
+    def get_threshold_percentile(self, expression_values, threshold: float) -> float:
+        """Percentage of values <= threshold, NaN counted in the total.
+
+        expression_values is either a column of data, looked up in the sorted index,
+        or a Series of other values.
+        """
+        if isinstance(expression_values, pd.Series):
+            sorted_index = SortedIndex(expression_values.to_frame())
+            feature = sorted_index.columns[0]
+        else:
+            sorted_index, feature = self.sorted_index, expression_values
+        return float(sorted_index.percentile_of(pd.Series([threshold], index=[feature]), columns=[feature]).iloc[0])
 
 
 class MeanTreshold(Threshold):
@@ -43,27 +63,24 @@ class PercentileThreshold(Threshold):
 
     _percentile: float
     
-    def __init__(self, data: pd.DataFrame, percentile: float):
-        super().__init__(data)
+    def __init__(self, data: pd.DataFrame, percentile: float, sorted_index: SortedIndex = None):
+        super().__init__(data, sorted_index)
         self._percentile = percentile
     
     def calculate_threshold(self) -> pd.Series:
-        return self.data.quantile(self._percentile/100.0)
+        return self.sorted_index.quantile(self._percentile/100.0)
 
 
 class NSampleThreshold(Threshold):
 
     _nb_samples: int
 
-    def __init__(self, data: pd.DataFrame, nb_samples: int):
-        super().__init__(data)
+    def __init__(self, data: pd.DataFrame, nb_samples: int, sorted_index: SortedIndex = None):
+        super().__init__(data, sorted_index)
         self._nb_samples = nb_samples
     
     def calculate_threshold(self, ascending=True) -> pd.Series:
-        threshold = pd.Series(index=self.data.columns, dtype=float)
-        for col in self.data.columns:
-            threshold[col] = self.data[col].sort_values(axis=0, ascending=ascending).head(self._nb_samples).tail(1)
-        return threshold
+        return self.sorted_index.nth_value(self._nb_samples, ascending=ascending)
 
 
 class NoiseThreshold(Threshold):
@@ -80,11 +97,11 @@ class NoiseThreshold(Threshold):
 
 class MaxTreshold(Threshold):
 
-    def __init__(self, data: pd.DataFrame):
-        super().__init__(data)
+    def __init__(self, data: pd.DataFrame, sorted_index: SortedIndex = None):
+        super().__init__(data, sorted_index)
 
     def calculate_threshold(self) -> pd.Series:
-        return self.data.max()
+        return self.sorted_index.max()
 
 
 # === Threshold Decorators ===
@@ -101,6 +118,14 @@ class ThresholdDecorator(Threshold):
     def threshold(self) -> pd.Series:
         return self._threshold
     
+    @property
+    def data(self) -> pd.DataFrame:
+        return self._threshold.data
+    
+    @property
+    def sorted_index(self) -> SortedIndex:
+        return self._threshold.sorted_index
+    
     def calculate_threshold(self) -> pd.Series:
         pass
 
@@ -118,7 +143,7 @@ class StdDecorator(ThresholdDecorator):
         return self._nb_std
     
     def calculate_threshold(self) -> pd.Series:
-        return self.threshold.calculate_threshold() + self.nb_std * self.threshold.data.std()
+        return self.threshold.calculate_threshold() + self.nb_std * self.data.std()
     
 
 # === Adaptive threshold ===
@@ -137,14 +162,39 @@ class AdaptiveThreshold(Threshold):
     _nb_folds: int
     _nb_cross_validations: int
     _cv_type: str
+    _survival_type: str
+    _survival_backend: str
+    _n_jobs: int
+    _cv_pruning: bool
+    _cv_adaptive_repeats: bool
+    _cv_ci_half_width: float
+    _survival_cache_size: int
+    _nb_permutations: int
+    _permutation_max_batch_size: int
+    _search: str
+    _coarse_factor: int
+    _cv_refine_margin: float
+    _prescreen: str
+    _prescreen_percentiles: tuple
+    _prescreen_p_value: float
+    _shard_index: int
+    _nb_shards: int
+    _random_state = None
+    _result_store = None # any object with get(key) and put(key, details), e.g. service.result_store.ResultStore
+    _observer: ThresholdObserver = None
+    _run_key: str
     
     _min_threshold: pd.Series
     _max_threshold: pd.Series
     
     _eligible_features: list
-    _dict_thresholds: dict # {'gene' : pd.DataFrame('thresholds', 'threshold_percentiles')} 
+    _results: ThresholdResults # candidate thresholds of the eligible features with their status, scores and optimum
     _cv_strategy: cross_validation.CrossValidationStrategy
+    _fold_cache: cross_validation.FoldSubsetCache
     _survival_model: survival.SurvivalModel
+    _cv_statistics: dict # {'nb_fits', 'nb_fits_skipped', 'nb_candidates_pruned', 'nb_early_stops', 'nb_threshold_fits', 'nb_threshold_fits_skipped'}
+    _prescreen_p_values: pd.Series # minimal pre-screen p-value of each eligible feature
+    _prescreen_statistics: dict # {'nb_prescreen_pruned', 'prescreen_seconds', 'prescreen_seconds_saved'}
 
     
     def __init__(
@@ -160,7 +210,27 @@ class AdaptiveThreshold(Threshold):
             min_reference_threshold: pd.Series = None,
             nb_folds: int = 3,
             nb_cross_validations: int = 1,
-            cv_type: str = 'stratified_k_fold'
+            cv_type: str = 'stratified_k_fold',
+            survival_type: str = 'cox',
+            survival_backend: str = 'lifelines',
+            n_jobs: int = 1,
+            cv_pruning: bool = False,
+            cv_adaptive_repeats: bool = False,
+            cv_ci_half_width: float = 15.0,
+            survival_cache_size: int = 0,
+            nb_permutations: int = 0,
+            permutation_max_batch_size: int = 2**22,
+            search: str = 'grid',
+            coarse_factor: int = 5,
+            cv_refine_margin: float = None,
+            prescreen: str = None,
+            prescreen_percentiles: tuple = (25.0, 50.0, 75.0),
+            prescreen_p_value: float = 0.5,
+            shard_index: int = 0,
+            nb_shards: int = 1,
+            random_state = None,
+            result_store = None,
+            observer: ThresholdObserver = None
             ):
         
         super().__init__(data)
@@ -175,14 +245,49 @@ class AdaptiveThreshold(Threshold):
         self._nb_folds = nb_folds
         self._nb_cross_validations = nb_cross_validations
         self._cv_type = cv_type
-    
-        self._dict_thresholds = dict()
+        self._survival_type = survival_type
+        self._survival_backend = survival_backend
+        self._n_jobs = os.cpu_count() if n_jobs==-1 else n_jobs
+        self._cv_pruning = cv_pruning
+        self._cv_adaptive_repeats = cv_adaptive_repeats
+        self._cv_ci_half_width = cv_ci_half_width
+        self._survival_cache_size = survival_cache_size
+        self._nb_permutations = nb_permutations
+        self._permutation_max_batch_size = permutation_max_batch_size
+        if search not in ('grid', 'coarse_to_fine'):
+            raise ValueError('Unknown threshold search: ' + str(search))
+        self._search = search
+        self._coarse_factor = coarse_factor
+        self._cv_refine_margin = cv_refine_margin
+        if prescreen not in (None, 'logrank', 'score'):
+            raise ValueError('Unknown pre-screen: ' + str(prescreen))
+        self._prescreen = prescreen
+        self._prescreen_percentiles = tuple(prescreen_percentiles)
+        self._prescreen_p_value = prescreen_p_value
+        if not 0<=shard_index<nb_shards:
+            raise ValueError('Shard index must be in [0, nb_shards): ' + str((shard_index, nb_shards)))
+        if nb_shards>1 and not isinstance(random_state, (int, np.integer)):
+            raise ValueError('Sharded runs need an integer random_state, so that every shard generates the same CV folds')
+        if result_store is not None and not isinstance(random_state, (int, np.integer)):
+            raise ValueError('Runs with a result_store need an integer random_state, so that a resumed run generates the same CV folds')
+        self._shard_index = shard_index
+        self._nb_shards = nb_shards
+        self._random_state = random_state
+        self._result_store = result_store
+        self._observer = observer
+        self._run_key = None
+    
+        self._results = None
+        self._cv_statistics = dict.fromkeys(['nb_fits', 'nb_fits_skipped', 'nb_candidates_pruned', 'nb_early_stops', 'nb_threshold_fits', 'nb_threshold_fits_skipped'], 0)
+        self._prescreen_p_values = None
+        self._prescreen_statistics = {'nb_prescreen_pruned': 0, 'prescreen_seconds': 0.0, 'prescreen_seconds_saved': 0.0}
         self._calulate_min_threshold()
         self._calulate_max_threshold()
         self._define_eligible_features()
         
         self._init_cv_strategy()
         self._init_survival_model()
+        self._init_fold_cache()
         
     
     @property
@@ -202,30 +307,80 @@ class AdaptiveThreshold(Threshold):
         return self._eligible_features
     
     @property
-    def dict_thresholds(self) -> dict:
-        return self._dict_thresholds
+    def dict_thresholds(self) -> ThresholdDetails:
+        """Details of every eligible feature, a mapping building each frame from the results table when looked up"""
+        if self._results is None:
+            return dict()
+        return ThresholdDetails(self._results)
+    
+    @property
+    def results(self) -> ThresholdResults:
+        return self._results
     
     @property
     def cross_validations(self) -> list:
         return self._cv_strategy.cross_validations
     
+    @property
+    def cv_statistics(self) -> dict:
+        return self._cv_statistics
+    
+    @property
+    def prescreen_p_values(self) -> pd.Series:
+        return self._prescreen_p_values
+    
+    @property
+    def survival_cache_statistics(self) -> dict:
+        return self._survival_model.cache_statistics
+    
+    @property
+    def statistics(self) -> dict:
+        """CV statistics with the number of survival models fitted, failed convergences, cache hits/misses and pre-screen report"""
+        statistics = dict(self._cv_statistics)
+        statistics.update(self._survival_model.fit_statistics)
+        cache_statistics = self._survival_model.cache_statistics
+        statistics['nb_cache_hits'] = cache_statistics['hits']
+        statistics['nb_cache_misses'] = cache_statistics['misses']
+        statistics.update(self._prescreen_statistics)
+        return statistics
+    
+    def _add_statistics(self, statistics: dict):
+        for key in self._cv_statistics:
+            self._cv_statistics[key] += statistics[key]
+        fit_statistics = {key: statistics[key] for key in self._survival_model.fit_statistics}
+        self._survival_model.add_statistics(fit_statistics, {'hits': statistics['nb_cache_hits'], 'misses': statistics['nb_cache_misses']})
+    
+    def __getstate__(self):
+        # observers may hold handlers or locks; they are only called from the main process
+        state = self.__dict__.copy()
+        state['_observer'] = None
+        return state
+    
     def get_details(self, feature) -> pd.DataFrame:
-        return self._dict_thresholds[feature]
+        if self._results is None or feature not in self._results:
+            raise KeyError(feature)
+        return self._results.get_details(feature)
         
     
     def _init_survival_model(self):
         options = {
             'survival_data': self._survival_data, 
             'duration_col': self._duration_col,
-            'event_col': self._event_col
+            'event_col': self._event_col,
+            'backend': self._survival_backend,
+            'cache_size': self._survival_cache_size
             }
-        self._survival_model = survival.Cox(**options)
+        if (self._survival_type=='logrank'):
+            self._survival_model = survival.Logrank(**options)
+        else:
+            self._survival_model = survival.Cox(**options)
     
     def _init_cv_strategy(self):
         options = {
             'data': self._data, 
             'nb_folds': self._nb_folds,
-            'nb_cross_validations': self._nb_cross_validations
+            'nb_cross_validations': self._nb_cross_validations,
+            'random_state': self._random_state
             }
         
         if (self._cv_type=='stratified_k_fold'):
@@ -234,14 +389,18 @@ class AdaptiveThreshold(Threshold):
         else:
             self._cv_strategy = cross_validation.KFoldStrategy(**options)
         self._cv_strategy.generate_cross_validations()
+    
+    def _init_fold_cache(self):
+        time, event = self._survival_model.get_survival_arrays(self.data.index)
+        self._fold_cache = cross_validation.FoldSubsetCache(self.data, time, event, self._cv_strategy.fold_positions)
    
         
     def _calulate_min_threshold(self):
         list_thresholds = []
         if self._percentile is not None:
-            list_thresholds.append(PercentileThreshold(self.data, self._percentile).calculate_threshold())
+            list_thresholds.append(PercentileThreshold(self.data, self._percentile, self.sorted_index).calculate_threshold())
         if self._min_nb_samples is not None:
-            list_thresholds.append(NSampleThreshold(self.data, self._min_nb_samples).calculate_threshold(ascending=True))
+            list_thresholds.append(NSampleThreshold(self.data, self._min_nb_samples, self.sorted_index).calculate_threshold(ascending=True))
         if self._noise_level is not None:
             list_thresholds.append(NoiseThreshold(self.data, self._noise_level).calculate_threshold())
         if self._min_reference_threshold is not None:
@@ -251,45 +410,130 @@ class AdaptiveThreshold(Threshold):
     def _calulate_max_threshold(self):
         list_thresholds = []
         if self._percentile is not None:
-            list_thresholds.append(PercentileThreshold(self.data, 100.0-self._percentile).calculate_threshold())
+            list_thresholds.append(PercentileThreshold(self.data, 100.0-self._percentile, self.sorted_index).calculate_threshold())
         if self._min_nb_samples is not None:
-            list_thresholds.append(NSampleThreshold(self.data, self._min_nb_samples).calculate_threshold(ascending=False))
+            list_thresholds.append(NSampleThreshold(self.data, self._min_nb_samples, self.sorted_index).calculate_threshold(ascending=False))
         self._max_threshold = pd.concat(list_thresholds, axis=1).min(axis=1)
         
     def _define_eligible_features(self):
+        """Features with a non-empty threshold range; with nb_shards>1, only those of this shard"""
         eligible_features = self._max_threshold>=self._min_threshold
-        self._eligible_features = list(eligible_features[eligible_features].index)
+        self._eligible_features = [
+            feature for feature in eligible_features[eligible_features].index 
+            if self._nb_shards==1 or get_feature_shard(feature, self._nb_shards)==self._shard_index
+            ]
+    
+    def _prescreen_features(self, features: list, chunk_size: int = 1000) -> list:
+        """Features whose pre-screen p-value is <= prescreen_p_value, the others being pruned.
+        
+        'logrank' takes the minimal log-rank p-value of the splits at prescreen_percentiles 
+        of each feature (clipped to its threshold range), 'score' the Cox score test of 
+        the expression values (survival.logrank_values). Both are vectorised numpy tests 
+        of chunks of features on one shared risk set, whatever survival_type and 
+        survival_backend. Features with an undefined p-value are kept. The cutoff is 
+        meant to be liberal: pruned features keep unfitted thresholds and no optimum.
+        Pruning is not lossless. On synthetic cohorts (benchmark.synthetic) at the 
+        default 0.5, 'logrank' pruned about 15% of the features and kept every 
+        feature whose optimum is validated by the full search. 'score' pruned about 
+        40% and lost up to 1 in 6 of them, because it only detects monotone effects.
+        """
+        time, event = self._survival_model.get_survival_arrays(self.data.index)
+        risk_set = self._survival_model.get_risk_set(time, event)
+        p_values = np.full(len(features), np.nan)
+        for start in range(0, len(features), chunk_size):
+            chunk = features[start:start + chunk_size]
+            values = self.data[chunk].to_numpy(dtype=float)
+            if self._prescreen=='score':
+                p_values[start:start + chunk_size] = survival.logrank_values(values, time, event, risk_set)[0]
+            else:
+                thresholds = np.array([self.sorted_index.percentiles(feature, self._prescreen_percentiles) for feature in chunk])
+                thresholds = np.clip(thresholds, self._min_threshold[chunk].to_numpy()[:, None], self._max_threshold[chunk].to_numpy()[:, None])
+                groups = (values[:, :, None]>thresholds[None, :, :]).reshape(values.shape[0], -1)
+                chunk_p_values = survival.logrank_groups(groups, time, event, risk_set)[0].reshape(len(chunk), -1)
+                p_values[start:start + chunk_size] = np.fmin.reduce(chunk_p_values, axis=1)
+        self._prescreen_p_values = pd.Series(p_values, index=pd.Index(features))
+        pruned = p_values>self._prescreen_p_value
+        self._prescreen_statistics['nb_prescreen_pruned'] = int(np.count_nonzero(pruned))
+        return [feature for feature, is_pruned in zip(features, pruned) if not is_pruned]
     
     def _generate_thresholds(self): 
-        for feature in self._eligible_features:
-            min_percentile = self.get_threshold_percentile(self.data[feature], self.min_threshold[feature])
-            max_percentile = self.get_threshold_percentile(self.data[feature], self.max_threshold[feature])
-            threshold_percentiles = np.arange(min_percentile, max_percentile + self._step_percentile, self._step_percentile)
-            thresholds = np.array([np.percentile(self.data[feature], p) for p in threshold_percentiles])
-            self._dict_thresholds[feature] = pd.DataFrame()
-            self._dict_thresholds[feature]['threshold'] = thresholds
-            self._dict_thresholds[feature]['threshold_percentile'] = threshold_percentiles
-            self._dict_thresholds[feature].index = ['T' + str(i+1) for i in range(len(thresholds))]
+        """Thresholds of the eligible features, every step_percentile percentiles from min to max threshold.
+
+        The threshold percentiles count NaN values in the total, and the thresholds are
+        the percentiles of the non-NaN values. np.percentile used to make every threshold
+        of a feature containing NaN NaN, so that none could be validated; such a feature
+        now gets the thresholds of its measured samples.
+        """
+        min_percentiles = self.sorted_index.percentile_of(self.min_threshold, self._eligible_features)
+        max_percentiles = self.sorted_index.percentile_of(self.max_threshold, self._eligible_features)
+        list_percentiles = [
+            np.arange(min_percentiles[feature], max_percentiles[feature] + self._step_percentile, self._step_percentile) 
+            for feature in self._eligible_features
+            ]
+        columns = {'threshold': float, 'threshold_percentile': float, 'p_value': float, 'hazard_ratio': float, 'validated': bool}
+        if self._nb_permutations>0:
+            columns['p_value_adjusted'] = float
+        columns.update({'cv_score': float, 'optimal': bool})
+        self._results = ThresholdResults(self._eligible_features, [len(percentiles) for percentiles in list_percentiles], columns)
+        for feature, threshold_percentiles in zip(self._eligible_features, list_percentiles):
+            self._results.get_column(feature, 'threshold')[:] = self.sorted_index.percentiles(feature, threshold_percentiles)
+            self._results.get_column(feature, 'threshold_percentile')[:] = threshold_percentiles
      
     def _calculate_threshold_status(self, feature):
-        pvalues = []
-        hrs = []
-        validated = []
-        for current_threshold in self.dict_thresholds[feature]['threshold']:
-            model_output = self._survival_model.calculate_model_for_threshold(feature, current_threshold, self.data)
-            pvalues.append(model_output[0])
-            hrs.append(model_output[1])
-            cox_group_validated = self._survival_model.is_significant(model_output)
-            validated.append(cox_group_validated)
-        self._dict_thresholds[feature]['p_value'] = pvalues
-        self._dict_thresholds[feature]['hazard_ratio'] = hrs
-        self._dict_thresholds[feature]['validated'] = validated  
-        self._dict_thresholds[feature]['cv_score'] = np.nan
-        self._dict_thresholds[feature]['optimal'] = False    
+        """p_value, hazard_ratio and validated status of the thresholds of a feature.
+        
+        The grid search fits every threshold. The coarse-to-fine search fits every 
+        coarse_factor-th threshold (and the last one), then the unfitted neighbours of 
+        validated thresholds until no new threshold is validated: each run of consecutive 
+        validated thresholds is fitted entirely, with its two bounds. Runs containing 
+        no coarse threshold are missed, so both searches validate the same thresholds 
+        whenever every run spans at least coarse_factor thresholds, i.e. 
+        coarse_factor * step_percentile percentiles. Unfitted thresholds keep NaN 
+        p_value and hazard_ratio and are not validated.
+        """
+        nb_thresholds = self._results.get_nb_thresholds(feature)
+        validated = self._results.get_column(feature, 'validated')
+        fitted = np.zeros(nb_thresholds, dtype=bool)
+        positions = np.arange(nb_thresholds) if self._search=='grid' else self._get_coarse_positions(nb_thresholds)
+        while len(positions)>0:
+            self._fit_thresholds(feature, positions)
+            fitted[positions] = True
+            validated_positions = positions[validated[positions]]
+            neighbours = np.union1d(validated_positions - 1, validated_positions + 1)
+            neighbours = neighbours[(neighbours>=0) & (neighbours<nb_thresholds)]
+            positions = neighbours[~fitted[neighbours]]
+        self._cv_statistics['nb_threshold_fits_skipped'] += int(nb_thresholds - np.count_nonzero(fitted))
+        if self._nb_permutations>0:
+            self._results.get_column(feature, 'p_value_adjusted')[:] = self._calculate_adjusted_p_values(feature)
+    
+    def _get_coarse_positions(self, nb_thresholds: int) -> np.ndarray:
+        return np.union1d(np.arange(0, nb_thresholds, self._coarse_factor), [nb_thresholds - 1]).astype(int)
+    
+    def _fit_thresholds(self, feature, positions: np.ndarray):
+        thresholds = self._results.get_column(feature, 'threshold')[positions]
+        model_outputs = self._survival_model.calculate_model_for_thresholds(feature, thresholds, self.data)
+        self._cv_statistics['nb_threshold_fits'] += len(positions)
+        self._results.get_column(feature, 'p_value')[positions] = [model_output[0] for model_output in model_outputs]
+        self._results.get_column(feature, 'hazard_ratio')[positions] = [model_output[1] for model_output in model_outputs]
+        self._results.get_column(feature, 'validated')[positions] = [self._survival_model.is_significant(model_output) for model_output in model_outputs]
+        
+    def _calculate_adjusted_p_values(self, feature) -> np.ndarray:
+        """Permutation p-values of the thresholds corrected for the choice of the best one (log-rank max statistic).
         
-    def _get_candidate_thresholds(self, feature) -> pd.DataFrame:
-        threshold_data = self._dict_thresholds[feature]
-        return threshold_data[threshold_data['validated']==True]
+        The permutations of a feature are seeded from random_state and the feature name, 
+        so they do not depend on the order or the process in which features are handled.
+        """
+        seed = None
+        if isinstance(self._random_state, (int, np.integer)):
+            seed = np.random.SeedSequence(int(self._random_state), spawn_key=(zlib.crc32(str(feature).encode()),))
+        permutation_test = permutation.MaxStatisticPermutationTest(self._nb_permutations, self._permutation_max_batch_size, seed)
+        groups = self._survival_model.generate_group_matrix(feature, self._results.get_column(feature, 'threshold'), self.data)
+        time, event = self._survival_model.get_survival_arrays(self.data.index)
+        return permutation_test.calculate_adjusted_p_values(groups, time, event)
+    
+    def _get_candidate_thresholds(self, feature) -> np.ndarray:
+        """Positions of the validated thresholds of a feature"""
+        return np.flatnonzero(self._results.get_column(feature, 'validated'))
     
     def _get_binarized_follow_up(self) -> pd.Series:
         events_only = self._survival_data[self._survival_data[self._event_col]>0]
@@ -302,40 +546,343 @@ class AdaptiveThreshold(Threshold):
     
      
     def _calculate_cross_validation_score(self, feature):
-        candidate_thresholds = self._get_candidate_thresholds(feature)
-        for ind_threshold in candidate_thresholds.index:
-            candidate_threshold_percentile = candidate_thresholds.loc[ind_threshold, 'threshold_percentile']
-            nb_cv_validated = 0
-            for ind_cv in range(len(self.cross_validations)):
-                is_cv_validated = True
-                dict_cross_validation_samples = self.cross_validations[ind_cv]
-                for dataset in ['train', 'test']:
-                    samples = dict_cross_validation_samples[dataset]
-                    dataset_data = self.data.loc[samples]
-                    candidate_threshold = dataset_data[feature].quantile(candidate_threshold_percentile / 100.0)
-                    model_output = self._survival_model.calculate_model_for_threshold(feature, candidate_threshold, dataset_data)
-                    cox_group_validated = self._survival_model.is_significant(model_output)
-                    is_cv_validated = is_cv_validated and cox_group_validated
-                if (is_cv_validated):
-                    nb_cv_validated = nb_cv_validated + 1
-            cv_score = 100.0 * nb_cv_validated / len(self.cross_validations)
-            self._dict_thresholds[feature].loc[ind_threshold, 'cv_score'] = cv_score   
+        """CV scores of the validated thresholds.
+        
+        With the coarse-to-fine search and a cv_refine_margin, coarse candidates are 
+        scored first; the other candidates are scored only when less than coarse_factor 
+        thresholds away from a coarse candidate scoring within cv_refine_margin of the 
+        best coarse score. This refinement is a heuristic: the optimum of the grid 
+        search is only guaranteed without a margin, every candidate being scored then.
+        """
+        positions = self._get_candidate_thresholds(feature)
+        if self._search=='grid' or self._cv_refine_margin is None:
+            self._score_candidates(feature, positions)
+            return
+        is_coarse = np.isin(positions, self._get_coarse_positions(self._results.get_nb_thresholds(feature)))
+        self._score_candidates(feature, positions[is_coarse])
+        coarse_scores = self._results.get_column(feature, 'cv_score')[positions[is_coarse]]
+        is_near = np.zeros(len(positions), dtype=bool)
+        if np.any(~np.isnan(coarse_scores)):
+            promising = positions[is_coarse][coarse_scores>=np.nanmax(coarse_scores) - self._cv_refine_margin]
+            is_near = (np.abs(positions[:, None] - promising[None, :])<self._coarse_factor).any(axis=1)
+        self._cv_statistics['nb_fits_skipped'] += 2 * len(self._fold_cache) * int(np.count_nonzero(~is_coarse & ~is_near))
+        self._score_candidates(feature, positions[~is_coarse & is_near])
+    
+    def _score_candidates(self, feature, positions: np.ndarray):
+        threshold_percentiles = self._results.get_column(feature, 'threshold_percentile')
+        cv_scores = self._results.get_column(feature, 'cv_score')
+        if self._cv_pruning:
+            # visiting candidates in the tie-breaking order of _get_optimal_threshold, 
+            # a later candidate can only become optimal with a strictly higher cv_score
+            p_values = self._results.get_column(feature, 'p_value')
+            positions = positions[np.lexsort((p_values[positions], -threshold_percentiles[positions]))]
+        best_cv_score = None
+        for position in positions:
+            cv_score = self._calculate_candidate_cv_score(feature, threshold_percentiles[position], best_cv_score)
+            cv_scores[position] = cv_score
+            if not np.isnan(cv_score) and (best_cv_score is None or cv_score>best_cv_score):
+                best_cv_score = cv_score
+    
+    def _calculate_candidate_cv_score(self, feature, candidate_threshold_percentile, best_cv_score=None) -> float:
+        """Percentage of CV folds validated on both train and test subsets.
+        
+        With cv_pruning, the test fit is skipped when the train fit is not significant, 
+        and the candidate is abandoned (NaN score) as soon as validating all remaining 
+        folds could not lift it above best_cv_score. With cv_adaptive_repeats, repeats 
+        stop once the 95% Wilson interval of the validated fraction of the folds done 
+        (at least 2 repeats) has a half-width below cv_ci_half_width percentage points.
+        Fold outcomes are pooled, so that identical repeats do not give a zero width. 
+        The interval is narrowest when all folds agree: at the default 15 points the 
+        rule can trigger after 9 folds (3 repeats of 3 folds) for candidates validated 
+        in none or all of them, and after about 40 when half of them are validated. 
+        Without agreement, 5 points needs 35 to 380 folds.
+        """
+        nb_cv = len(self._fold_cache)
+        nb_cv_validated = 0
+        nb_cv_done = 0
+        for ind_cv in range(nb_cv):
+            nb_cv_remaining = nb_cv - ind_cv
+            if self._cv_pruning and best_cv_score is not None and 100.0 * (nb_cv_validated + nb_cv_remaining) / nb_cv<=best_cv_score:
+                self._cv_statistics['nb_fits_skipped'] += 2 * nb_cv_remaining
+                self._cv_statistics['nb_candidates_pruned'] += 1
+                return np.nan
+            is_cv_validated = True
+            for dataset in ['train', 'test']:
+                if self._cv_pruning and not is_cv_validated:
+                    self._cv_statistics['nb_fits_skipped'] += 1
+                    continue
+                values = self._fold_cache.get_values(feature, ind_cv, dataset)
+                candidate_threshold = self._fold_cache.get_quantile(feature, ind_cv, dataset, candidate_threshold_percentile / 100.0)
+                time, event = self._fold_cache.get_survival_arrays(ind_cv, dataset)
+                pvalues, hrs = self._survival_model.calculate_model_for_groups((values>candidate_threshold)[:, None], time, event, subset=(ind_cv, dataset))
+                model_output = (pvalues[0], hrs[0])
+                self._cv_statistics['nb_fits'] += 1
+                cox_group_validated = self._survival_model.is_significant(model_output)
+                is_cv_validated = is_cv_validated and cox_group_validated
+            if (is_cv_validated):
+                nb_cv_validated = nb_cv_validated + 1
+            nb_cv_done = nb_cv_done + 1
+            if self._cv_adaptive_repeats and nb_cv_done % self._nb_folds==0 and nb_cv_done<nb_cv:
+                if nb_cv_done>=2 * self._nb_folds and self._is_cv_score_precise(nb_cv_validated, nb_cv_done):
+                    self._cv_statistics['nb_fits_skipped'] += 2 * (nb_cv - nb_cv_done)
+                    self._cv_statistics['nb_early_stops'] += 1
+                    break
+        return 100.0 * nb_cv_validated / nb_cv_done
+    
+    def _is_cv_score_precise(self, nb_cv_validated: int, nb_cv_done: int) -> bool:
+        z = 1.959963984540054
+        rate = nb_cv_validated / nb_cv_done
+        half_width = z * np.sqrt(rate * (1.0 - rate) / nb_cv_done + z * z / (4.0 * nb_cv_done**2)) / (1.0 + z * z / nb_cv_done)
+        return 100.0 * half_width<=self._cv_ci_half_width
    
-    def _get_optimal_threshold(self, feature):
-        optimal = self._dict_thresholds[feature].sort_values(by=['validated', 'cv_score', 'threshold_percentile', 'p_value'], ascending=[False, False, False, True]).head(1)
-        self._dict_thresholds[feature].loc[optimal.index, 'optimal'] = True
-        optimal.loc[:, 'optimal'] = True
-        return optimal
+    def _get_optimal_threshold(self, feature) -> int:
+        """Position of the optimal threshold: validated first, then highest cv_score, highest percentile and lowest p_value"""
+        cv_scores = self._results.get_column(feature, 'cv_score')
+        p_values = self._results.get_column(feature, 'p_value')
+        sort_keys = (
+            np.where(np.isnan(p_values), np.inf, p_values),
+            -self._results.get_column(feature, 'threshold_percentile'),
+            np.where(np.isnan(cv_scores), np.inf, -cv_scores),
+            ~self._results.get_column(feature, 'validated')
+            )
+        position = int(np.lexsort(sort_keys)[0])
+        self._results.get_column(feature, 'optimal')[position] = True
+        return position
+    
+    def _process_feature(self, feature) -> tuple:
+        """(details, timings, statistics) of a feature, timings in seconds per stage and statistics counted on this feature only"""
+        statistics = self.statistics
+        timings = dict()
+        start = perf_counter()
+        self._calculate_threshold_status(feature)
+        timings['threshold_status'] = perf_counter() - start
+        start = perf_counter()
+        self._calculate_cross_validation_score(feature)
+        timings['cross_validation'] = perf_counter() - start
+        start = perf_counter()
+        self._get_optimal_threshold(feature)
+        timings['optimal_threshold'] = perf_counter() - start
+        statistics = {key: value - statistics[key] for key, value in self.statistics.items()}
+        return (self._results.get_details(feature), timings, statistics)
+    
+    def _get_run_key(self) -> str:
+        """Hash of everything a feature result depends on besides the feature itself"""
+        if self._run_key is None:
+            run_hash = hashlib.blake2b(digest_size=16)
+            parameters = [
+                self._percentile, self._step_percentile, self._min_nb_samples, self._noise_level, 
+                self._nb_folds, self._nb_cross_validations, self._cv_type, self._survival_type, self._survival_backend, 
+                self._cv_pruning, self._cv_adaptive_repeats, self._cv_ci_half_width
+                ]
+            if self._search!='grid':
+                parameters.extend([self._search, self._coarse_factor, self._cv_refine_margin])
+            if self._nb_permutations>0:
+                parameters.extend([self._nb_permutations, repr(self._random_state)])
+            run_hash.update(repr(parameters).encode())
+            run_hash.update('\n'.join(str(sample) for sample in self.data.index).encode())
+            for survival_array in self._survival_model.get_survival_arrays(self.data.index):
+                run_hash.update(survival_array.tobytes())
+            for fold in self._cv_strategy.fold_positions:
+                run_hash.update(fold['train'].tobytes())
+                run_hash.update(fold['test'].tobytes())
+            self._run_key = run_hash.hexdigest()
+        return self._run_key
+    
+    def _get_fold_key(self) -> str:
+        fold_hash = hashlib.blake2b(digest_size=16)
+        for fold in self._cv_strategy.fold_positions:
+            fold_hash.update(fold['train'].tobytes())
+            fold_hash.update(fold['test'].tobytes())
+        return fold_hash.hexdigest()
+    
+    def _get_input_key(self) -> str:
+        """Hash of the feature keys of every feature of the data, shards included"""
+        input_hash = hashlib.blake2b(digest_size=16)
+        for feature in self.data.columns:
+            input_hash.update(self.get_feature_key(feature).encode())
+        return input_hash.hexdigest()
+    
+    def get_parameters(self) -> dict:
+        """Parameters the details depend on, n_jobs, stores, observers and shards aside"""
+        return {
+            'duration_col': self._duration_col, 'event_col': self._event_col, 'noise_level': self._noise_level, 
+            'percentile': self._percentile, 'step_percentile': self._step_percentile, 'min_nb_samples': self._min_nb_samples, 
+            'nb_folds': self._nb_folds, 'nb_cross_validations': self._nb_cross_validations, 'cv_type': self._cv_type, 
+            'survival_type': self._survival_type, 'survival_backend': self._survival_backend, 
+            'cv_pruning': self._cv_pruning, 'cv_adaptive_repeats': self._cv_adaptive_repeats, 'cv_ci_half_width': self._cv_ci_half_width, 
+            'nb_permutations': self._nb_permutations, 'search': self._search, 'coarse_factor': self._coarse_factor, 
+            'cv_refine_margin': self._cv_refine_margin, 'prescreen': self._prescreen, 
+            'prescreen_percentiles': self._prescreen_percentiles, 'prescreen_p_value': self._prescreen_p_value, 
+            'random_state': self._random_state
+            }
+    
+    def write_shard(self, path: str):
+        """Write the results of this shard to a self-describing partial file, combined by merge_shards.
+        
+        Besides the results table and the statistics, the file holds the parameters, 
+        the shard, the data columns and keys of the CV folds, of the samples with their 
+        survival (run key) and of the whole input data, so that merge_shards can check 
+        that all shards ran the same analysis.
+        """
+        if self._results is None:
+            raise ValueError('calculate_threshold must run before write_shard')
+        shard = {
+            'format': SHARD_FORMAT,
+            'parameters': self.get_parameters(),
+            'shard_index': self._shard_index,
+            'nb_shards': self._nb_shards,
+            'features': list(self.data.columns),
+            'fold_key': self._get_fold_key(),
+            'run_key': self._get_run_key(),
+            'input_key': self._get_input_key(),
+            'statistics': self.statistics,
+            'results': self._results.to_frame()
+            }
+        pd.to_pickle(shard, path + '.tmp', compression=None)
+        os.replace(path + '.tmp', path)
+    
+    def get_feature_key(self, feature) -> str:
+        """Content key of a feature result: its values, its reference threshold and the run key"""
+        feature_hash = hashlib.blake2b(digest_size=16)
+        feature_hash.update(self._get_run_key().encode())
+        feature_hash.update(str(feature).encode())
+        feature_hash.update(self.data[feature].to_numpy(dtype=float).tobytes())
+        if self._min_reference_threshold is not None:
+            feature_hash.update(repr(float(self._min_reference_threshold[feature])).encode())
+        return feature_hash.hexdigest()
+    
+    def _load_checkpoints(self, features: list) -> list:
+        """Details of features already in the result store; returns the features left to compute"""
+        if self._result_store is None:
+            return list(features)
+        features_left = []
+        for feature in features:
+            details = self._result_store.get(self.get_feature_key(feature))
+            if details is None:
+                features_left.append(feature)
+            else:
+                self._results.set_details(feature, details)
+        return features_left
+    
+    def _save_checkpoint(self, feature):
+        if self._result_store is not None:
+            self._result_store.put(self.get_feature_key(feature), self._results.get_details(feature))
+    
+    def _process_features(self, features: list):
+        """(feature, details, timings, statistics) of each feature, in completion order"""
+        if self._n_jobs is None or self._n_jobs<=1 or len(features)<2:
+            for feature in features:
+                yield (feature, *self._process_feature(feature))
+            return
+        # the instance, with its data and CV folds, is pickled once per worker
+        chunksize = max(1, len(features) // (4 * self._n_jobs))
+        chunks = [features[start:start + chunksize] for start in range(0, len(features), chunksize)]
+        with ProcessPoolExecutor(max_workers=self._n_jobs, initializer=_init_worker, initargs=(self,)) as executor:
+            futures = [executor.submit(_process_features_in_worker, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                for feature, details, timings, statistics in future.result():
+                    self._add_statistics(statistics)
+                    yield (feature, details, timings, statistics)
     
     def calculate_threshold(self) -> pd.Series:
+        """Optimal threshold of each feature, NaN when there is none.
+        
+        With a pre-screen, pruned features are not processed; prescreen_seconds_saved 
+        estimates the time saved as their number times the mean processing time of the 
+        features processed in this run, minus the pre-screen time.
+        """
         adaptive = pd.Series(index=self.data.columns, dtype=float)
+        run_start = perf_counter()
+        start = run_start
         self._generate_thresholds()
-        for feature in self._eligible_features:
-            print('Processing feature', feature)
-            self._calculate_threshold_status(feature)
-            self._calculate_cross_validation_score(feature)
-            optimal_threshold = self._get_optimal_threshold(feature)
-            print('Optimal threshold for', feature)
-            print(optimal_threshold)
-            adaptive.loc[feature] =  optimal_threshold.iloc[0]['threshold']
-        return adaptive
\ No newline at end of file
+        self._notify('on_stage', 'generate_thresholds', perf_counter() - start)
+        features = self._eligible_features
+        if self._prescreen is not None:
+            start = perf_counter()
+            features = self._prescreen_features(features)
+            self._prescreen_statistics['prescreen_seconds'] = perf_counter() - start
+            self._notify('on_stage', 'prescreen', self._prescreen_statistics['prescreen_seconds'])
+        nb_features = len(features)
+        start = perf_counter()
+        features = self._load_checkpoints(features)
+        self._notify('on_stage', 'load_checkpoints', perf_counter() - start)
+        self._notify('on_run_start', nb_features, nb_features - len(features))
+        processing_seconds = 0.0
+        for feature, details, timings, statistics in self._process_features(features):
+            processing_seconds += sum(timings.values())
+            self._results.set_details(feature, details)
+            start = perf_counter()
+            self._save_checkpoint(feature)
+            if self._result_store is not None:
+                timings['save_checkpoint'] = perf_counter() - start
+            self._notify('on_feature', feature, timings, statistics, details)
+        if self._prescreen is not None and len(features)>0:
+            self._prescreen_statistics['prescreen_seconds_saved'] = (
+                self._prescreen_statistics['nb_prescreen_pruned'] * processing_seconds / len(features) - self._prescreen_statistics['prescreen_seconds']
+                )
+        optimal_thresholds = self._results.get_optimal_thresholds()
+        adaptive.loc[optimal_thresholds.index] = optimal_thresholds
+        self._notify('on_run_end', perf_counter() - run_start, self.statistics)
+        return adaptive
+    
+    def _notify(self, hook: str, *args):
+        if self._observer is not None:
+            getattr(self._observer, hook)(*args)
+
+
+# === Shards ===
+
+SHARD_FORMAT = ('ectopy.adaptive_threshold.shard', 1)
+
+def get_feature_shard(feature, nb_shards: int) -> int:
+    """Shard of a feature, from a hash of its name that is the same in every process and on every platform"""
+    return zlib.crc32(str(feature).encode()) % nb_shards
+
+def merge_shards(paths: list) -> dict:
+    """Combine the files written by write_shard for every shard of a run.
+    
+    Raises ValueError unless the files come from shards 0..N-1 of one run, each once,
+    with the same parameters, CV folds, samples, survival and input data. Returns a 
+    dict with the adaptive 'thresholds' of every data column (NaN when not eligible), 
+    the merged ThresholdResults as 'results', the summed 'statistics' and the 'parameters'.
+    """
+    shards = [pd.read_pickle(path, compression=None) for path in paths]
+    if len(shards)==0:
+        raise ValueError('No shard to merge')
+    for path, shard in zip(paths, shards):
+        if not isinstance(shard, dict) or shard.get('format')!=SHARD_FORMAT:
+            raise ValueError('Not an adaptive threshold shard file: ' + str(path))
+    reference = shards[0]
+    for path, shard in zip(paths[1:], shards[1:]):
+        different = sorted(key for key in set(reference['parameters']) | set(shard['parameters']) if reference['parameters'].get(key)!=shard['parameters'].get(key))
+        if len(different)>0:
+            raise ValueError('Parameters of ' + str(path) + ' differ from ' + str(paths[0]) + ': ' + ', '.join(different))
+        for key, description in [('nb_shards', 'number of shards'), ('features', 'data columns'), ('fold_key', 'CV folds'), ('run_key', 'samples or survival data'), ('input_key', 'input data')]:
+            if shard[key]!=reference[key]:
+                raise ValueError('The ' + description + ' of ' + str(path) + ' differ from ' + str(paths[0]))
+    shard_indexes = sorted(shard['shard_index'] for shard in shards)
+    if shard_indexes!=list(range(reference['nb_shards'])):
+        raise ValueError('Shards ' + str(shard_indexes) + ' do not cover each of the ' + str(reference['nb_shards']) + ' shards once')
+    
+    frame = pd.concat([shard['results'] for shard in shards], ignore_index=True)
+    frame['feature'] = frame['feature'].astype(object)
+    positions = pd.Index(reference['features']).get_indexer(frame['feature'])
+    frame = frame.iloc[np.lexsort((frame['threshold_number'].to_numpy(), positions))].reset_index(drop=True)
+    results = ThresholdResults.from_frame(frame)
+    thresholds = pd.Series(index=pd.Index(reference['features']), dtype=float)
+    optimal_thresholds = results.get_optimal_thresholds()
+    thresholds.loc[optimal_thresholds.index] = optimal_thresholds
+    statistics = {key: sum(shard['statistics'][key] for shard in shards) for key in reference['statistics']}
+    return {'thresholds': thresholds, 'results': results, 'statistics': statistics, 'parameters': reference['parameters']}
+
+
+# === Process pool workers ===
+
+_worker_adaptive_threshold: AdaptiveThreshold = None
+
+def _init_worker(adaptive_threshold: AdaptiveThreshold):
+    global _worker_adaptive_threshold
+    _worker_adaptive_threshold = adaptive_threshold
+
+def _process_features_in_worker(features: list) -> list:
+    return [(feature, *_worker_adaptive_threshold._process_feature(feature)) for feature in features]
\ No newline at end of file
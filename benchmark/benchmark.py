@@ -0,0 +1,136 @@
+"""Time each stage of the threshold pipeline on a synthetic cohort and write the timings as JSON.
+
+Run from the repository root, e.g.
+    python -m benchmark.benchmark --genes 50 --samples 1000 --backend numpy --output bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from analysis import threshold, expression_analysis
+from benchmark.synthetic import generate_cohort, get_cohort_info
+
+
+def time_stage(function, nb_repeats: int = 1) -> dict:
+    """Best and mean wall time of nb_repeats calls of function, its printouts discarded"""
+    timings = []
+    for _ in range(nb_repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+    return {'seconds': min(timings), 'mean_seconds': float(np.mean(timings)), 'nb_repeats': nb_repeats}
+
+
+def _get_version() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+        nb_genes: int = 50,
+        nb_samples: int = 500,
+        nb_normal_samples: int = 50,
+        event_rate: float = 0.6,
+        nb_folds: int = 3,
+        nb_cross_validations: int = 1,
+        cv_type: str = 'stratified_k_fold',
+        survival_type: str = 'cox',
+        survival_backend: str = 'lifelines',
+        nb_repeats: int = 1,
+        random_state: int = 0
+        ) -> dict:
+    data, expgroup = generate_cohort(nb_genes, nb_samples, nb_normal_samples, event_rate, random_state=random_state)
+    expgroup_normal = expgroup[expgroup['group']=='normal']
+    expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+    normal = data.loc[expgroup_normal.index, :]
+    tumoral = data.loc[expgroup_tumoral.index, :]
+    options = {
+        'nb_folds': nb_folds,
+        'nb_cross_validations': nb_cross_validations,
+        'cv_type': cv_type,
+        'survival_type': survival_type,
+        'survival_backend': survival_backend,
+        'random_state': random_state
+        }
+    stages = dict()
+
+    m2sd_threshold = threshold.StdDecorator(threshold.MeanTreshold(normal), nb_std=2).calculate_threshold()
+    max_threshold = threshold.MaxTreshold(normal).calculate_threshold()
+    frequency = expression_analysis.ExpressionFrequency()
+    stages['expression_frequency'] = time_stage(lambda: frequency.calculate_expression_frequency(tumoral, m2sd_threshold), nb_repeats)
+    stages['expression_frequencies'] = time_stage(lambda: frequency.calculate_expression_frequencies(tumoral, {'m2sd': m2sd_threshold, 'max': max_threshold}), nb_repeats)
+
+    stages['init'] = time_stage(lambda: threshold.AdaptiveThreshold(tumoral, expgroup_tumoral, **options), nb_repeats)
+    adaptive_threshold = threshold.AdaptiveThreshold(tumoral, expgroup_tumoral, **options)
+    stages['cv_strategy'] = time_stage(adaptive_threshold._cv_strategy.generate_cross_validations, nb_repeats)
+
+    def calculate_min_threshold():
+        adaptive_threshold._sorted_index = None
+        adaptive_threshold._calulate_min_threshold()
+    stages['min_threshold'] = time_stage(calculate_min_threshold, nb_repeats)
+    stages['generate_thresholds'] = time_stage(adaptive_threshold._generate_thresholds, nb_repeats)
+
+    features = adaptive_threshold.eligible_features
+    def calculate_threshold_status():
+        for feature in features:
+            adaptive_threshold._calculate_threshold_status(feature)
+    stages['threshold_status'] = time_stage(calculate_threshold_status, nb_repeats)
+
+    def calculate_cross_validation_score():
+        for feature in features:
+            adaptive_threshold._calculate_cross_validation_score(feature)
+    stages['cross_validation_score'] = time_stage(calculate_cross_validation_score, nb_repeats)
+
+    nb_thresholds = sum(len(adaptive_threshold.get_details(feature)) for feature in features)
+    nb_candidates = sum(int(adaptive_threshold.get_details(feature)['validated'].sum()) for feature in features)
+    return {
+        'version': _get_version(),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__},
+        'cohort': get_cohort_info(data, expgroup),
+        'options': options,
+        'nb_eligible_features': len(features),
+        'nb_thresholds': nb_thresholds,
+        'nb_candidate_thresholds': nb_candidates,
+        'stages': stages
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the adaptive threshold pipeline on a synthetic cohort')
+    parser.add_argument('--genes', type=int, default=50)
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--normal-samples', type=int, default=50)
+    parser.add_argument('--event-rate', type=float, default=0.6)
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--cross-validations', type=int, default=1)
+    parser.add_argument('--cv-type', default='stratified_k_fold', choices=['stratified_k_fold', 'k_fold'])
+    parser.add_argument('--survival-type', default='cox', choices=['cox', 'logrank'])
+    parser.add_argument('--backend', default='lifelines', choices=['lifelines', 'numpy'])
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file, printed to stdout when omitted')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    results = run_benchmark(
+        args.genes, args.samples, args.normal_samples, args.event_rate, args.folds, args.cross_validations,
+        args.cv_type, args.survival_type, args.backend, args.repeats, args.seed
+        )
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
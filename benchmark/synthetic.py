@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+
+def generate_cohort(
+        nb_genes: int = 100,
+        nb_samples: int = 500,
+        nb_normal_samples: int = 50,
+        event_rate: float = 0.6,
+        fraction_prognostic: float = 0.2,
+        hazard_ratio: float = 2.0,
+        random_state = None
+        ) -> tuple:
+    """Synthetic expression and censored survival data shaped like data/data.csv and data/expgroup.csv.
+
+    Returns (data, expgroup): a samples x genes log-expression frame and a frame with
+    'group' ('normal' or 'tumoral'), 'time' and 'event' columns, indexed by 'id_sample'.
+    In a fraction_prognostic of the genes, tumoral samples over a gene-specific
+    activation threshold have their hazard multiplied by hazard_ratio. Censoring
+    times are uniform over the event times, scaled so that about event_rate of
+    the tumoral samples have an event.
+    """
+    rng = np.random.default_rng(random_state)
+    nb_tumoral = nb_samples
+    samples = ['S' + str(i+1) for i in range(nb_normal_samples + nb_tumoral)]
+    genes = ['G' + str(i+1) for i in range(nb_genes)]
+
+    # normal tissue around a gene-specific baseline, a variable part of the tumours activated above it
+    baseline = rng.normal(2.0, 0.5, size=nb_genes)
+    normal = baseline + rng.normal(0.0, 0.3, size=(nb_normal_samples, nb_genes))
+    activation_rate = rng.uniform(0.1, 0.6, size=nb_genes)
+    activated = rng.random((nb_tumoral, nb_genes))<activation_rate
+    tumoral = baseline + rng.normal(0.0, 0.3, size=(nb_tumoral, nb_genes)) + activated * rng.gamma(2.0, 1.0, size=(nb_tumoral, nb_genes))
+    data = pd.DataFrame(np.vstack([normal, tumoral]), index=pd.Index(samples, name='id_sample'), columns=genes)
+
+    prognostic = rng.random(nb_genes)<fraction_prognostic
+    log_hazard = np.log(hazard_ratio) * activated[:, prognostic].sum(axis=1)
+    event_time = rng.exponential(1.0, size=nb_tumoral) * np.exp(-log_hazard) * 60.0
+    censoring_time = _calibrate_censoring(rng, event_time, event_rate)
+    time = np.minimum(event_time, censoring_time)
+    event = (event_time<=censoring_time).astype(float)
+
+    expgroup = pd.DataFrame(index=data.index)
+    expgroup['group'] = ['normal'] * nb_normal_samples + ['tumoral'] * nb_tumoral
+    expgroup['time'] = np.concatenate([np.full(nb_normal_samples, np.nan), np.maximum(np.round(time, 1), 0.1)])
+    expgroup['event'] = np.concatenate([np.full(nb_normal_samples, np.nan), event])
+    return data, expgroup
+
+
+def _calibrate_censoring(rng: np.random.Generator, event_time: np.ndarray, event_rate: float) -> np.ndarray:
+    """Uniform censoring times whose upper bound is bisected to reach the event rate"""
+    if event_rate>=1.0:
+        return np.full(len(event_time), np.inf)
+    uniform = rng.random(len(event_time))
+    lower, upper = 0.0, event_time.max() / max(1.0 - event_rate, 1e-6)
+    for _ in range(50):
+        middle = (lower + upper) / 2.0
+        if np.mean(event_time<=uniform * middle)<event_rate:
+            lower = middle
+        else:
+            upper = middle
+    return uniform * upper
+
+
+def get_cohort_info(data: pd.DataFrame, expgroup: pd.DataFrame) -> dict:
+    tumoral = expgroup[expgroup['group']=='tumoral']
+    return {
+        'nb_genes': data.shape[1],
+        'nb_samples': int(tumoral.shape[0]),
+        'nb_normal_samples': int((expgroup['group']=='normal').sum()),
+        'event_rate': float(tumoral['event'].mean())
+        }
@@ -0,0 +1,178 @@
+"""Thresholds and activation frequencies of several cohorts in one run.
+
+    python -m main.cli manifest.json --output-dir results --n-jobs 4
+
+The manifest is a JSON file listing the cohorts, with paths relative to the manifest:
+
+    {
+        "options": {"adaptive": true, "nb_folds": 3},
+        "cohorts": [
+            {"name": "BRCA", "data": "brca/data.csv", "expgroup": "brca/expgroup.csv"},
+            {"name": "LUAD", "data": "luad/data.csv", "expgroup": "luad/expgroup.csv"}
+        ]
+    }
+
+data and expgroup are ';'-separated CSV files indexed by id_sample, as in data/. Each
+cohort goes through DataConsistency, the m2sd and max-normal thresholds (and the
+adaptive threshold when "adaptive" is set), then ExpressionFrequency. Cohorts run on
+one pool of worker processes; the results of a cohort are written to
+<output-dir>/<name>/ as soon as it finishes.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from analysis import threshold, expression_analysis
+from service.data_consistency import DataConsistency
+from service.expression_store import ExpressionStore, load_expression
+
+logger = logging.getLogger('ectopy')
+
+
+def read_manifest(manifest_path: str) -> dict:
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    names = set()
+    for cohort in manifest['cohorts']:
+        for key in ['name', 'data', 'expgroup']:
+            if key not in cohort:
+                raise ValueError('Cohort without ' + key + ' in manifest: ' + str(cohort))
+        if cohort['name'] in names:
+            raise ValueError('Duplicate cohort in manifest: ' + str(cohort['name']))
+        names.add(cohort['name'])
+        cohort['data'] = os.path.join(manifest_dir, cohort['data'])
+        cohort['expgroup'] = os.path.join(manifest_dir, cohort['expgroup'])
+    manifest.setdefault('options', dict())
+    return manifest
+
+
+# === Cohort processing, run in the worker processes ===
+
+# Tables shared by the cohorts handled in a worker. Expgroups are small and all kept; expression
+# matrices are kept in an LRU of max_worker_expressions, memory-mapped stores or parsed CSVs alike
+max_worker_expressions = 2
+_worker_expressions = OrderedDict() # {(path, cache_dir): DataFrame}
+_worker_expgroups = dict() # {path: DataFrame}
+
+def _get_store_dir(path: str, cache_dir: str) -> str:
+    path = os.path.abspath(path)
+    path_key = hashlib.blake2b(path.encode(), digest_size=4).hexdigest()
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(path))[0] + '_' + path_key)
+
+def _load_table(path: str, cache_dir: str = None, expression: bool = False) -> pd.DataFrame:
+    path = os.path.abspath(path)
+    if not expression:
+        if path not in _worker_expgroups:
+            _worker_expgroups[path] = pd.read_csv(path, sep=';', index_col='id_sample')
+        return _worker_expgroups[path]
+    key = (path, cache_dir)
+    if key in _worker_expressions:
+        _worker_expressions.move_to_end(key)
+        return _worker_expressions[key]
+    if cache_dir is not None:
+        table = load_expression(path, cache_dir=_get_store_dir(path, cache_dir))
+    else:
+        table = pd.read_csv(path, sep=';', index_col='id_sample')
+    _worker_expressions[key] = table
+    while len(_worker_expressions)>max_worker_expressions:
+        _worker_expressions.popitem(last=False)
+    return table
+
+
+def process_cohort(cohort: dict, options: dict, cache_dir: str = None) -> dict:
+    """Consistency stats, thresholds, frequencies and adaptive details of a cohort"""
+    data = _load_table(cohort['data'], cache_dir, expression=True)
+    expgroup = _load_table(cohort['expgroup'])
+    data_consistency = DataConsistency()
+    normal, _ = data_consistency.align_samples(data, expgroup[expgroup['group']=='normal'])
+    tumoral, expgroup_tumoral = data_consistency.align_samples(data, expgroup[expgroup['group']=='tumoral'])
+
+    consistency = data_consistency.calculate_consistency_stats(tumoral, expgroup_tumoral)
+    thresholds = {
+        'm2sd': threshold.StdDecorator(threshold.MeanTreshold(normal), nb_std=2).calculate_threshold(),
+        'max_normal': threshold.MaxTreshold(normal).calculate_threshold()
+        }
+    details = None
+    if options.get('adaptive', False):
+        adaptive_options = {key: value for key, value in options.items() if key!='adaptive'}
+        adaptive_options['n_jobs'] = 1 # cohorts are the unit of parallelism
+        adaptive_threshold = threshold.AdaptiveThreshold(
+            data=tumoral, survival_data=expgroup_tumoral,
+            min_reference_threshold=thresholds['max_normal'], **adaptive_options
+            )
+        thresholds['adaptive'] = adaptive_threshold.calculate_threshold()
+        details = pd.concat({feature: adaptive_threshold.get_details(feature) for feature in adaptive_threshold.eligible_features}, names=['feature', 'id_threshold'])
+    thresholds = pd.DataFrame(thresholds)
+    thresholds.index.name = 'feature'
+    frequencies = expression_analysis.ExpressionFrequency().calculate_expression_frequencies(tumoral, thresholds)
+    return {'name': cohort['name'], 'consistency': consistency, 'thresholds': thresholds, 'frequencies': frequencies, 'details': details}
+
+
+# === Output ===
+
+def write_cohort_results(results: dict, output_dir: str):
+    cohort_dir = os.path.join(output_dir, str(results['name']))
+    os.makedirs(cohort_dir, exist_ok=True)
+    consistency = dict(results['consistency'])
+    consistency['data'] = dict(consistency['data'])
+    for key in ['missing_per_sample', 'missing_per_feature']:
+        missing = consistency['data'][key]
+        consistency['data'][key] = {str(label): int(nb_missing) for label, nb_missing in missing[missing>0].items()}
+    consistency['common_samples'] = [str(sample) for sample in consistency['common_samples']]
+    with open(os.path.join(cohort_dir, 'consistency.json'), 'w') as consistency_file:
+        json.dump(consistency, consistency_file, indent=2)
+    results['thresholds'].to_csv(os.path.join(cohort_dir, 'thresholds.csv'), sep=';')
+    results['frequencies'].to_csv(os.path.join(cohort_dir, 'frequencies.csv'), sep=';')
+    if results['details'] is not None:
+        results['details'].to_csv(os.path.join(cohort_dir, 'adaptive_details.csv'), sep=';')
+
+
+def prepare_expression_stores(cohorts: list, cache_dir: str):
+    """Convert each distinct expression CSV of the cohorts once, before workers memory-map the stores"""
+    for path in dict.fromkeys(os.path.abspath(cohort['data']) for cohort in cohorts):
+        store_dir = _get_store_dir(path, cache_dir)
+        if not ExpressionStore.is_up_to_date(path, store_dir):
+            ExpressionStore.convert(path, store_dir)
+
+
+def run_manifest(manifest: dict, output_dir: str, n_jobs: int = 1, cache_dir: str = None):
+    """Process the cohorts of a manifest, yielding each cohort name once its results are written"""
+    cohorts = manifest['cohorts']
+    options = manifest['options']
+    if cache_dir is not None:
+        prepare_expression_stores(cohorts, cache_dir)
+    if n_jobs is None or n_jobs<=1 or len(cohorts)<2:
+        for cohort in cohorts:
+            write_cohort_results(process_cohort(cohort, options, cache_dir), output_dir)
+            yield cohort['name']
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = {executor.submit(process_cohort, cohort, options, cache_dir): cohort['name'] for cohort in cohorts}
+        for future in as_completed(futures):
+            write_cohort_results(future.result(), output_dir)
+            yield futures[future]
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Thresholds and activation frequencies of the cohorts of a manifest')
+    parser.add_argument('manifest', help='JSON manifest of the cohorts')
+    parser.add_argument('--output-dir', default='results')
+    parser.add_argument('--n-jobs', type=int, default=1, help='number of worker processes, -1 for all CPUs')
+    parser.add_argument('--cache-dir', help='directory of memory-mapped expression stores reused between runs')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    manifest = read_manifest(args.manifest)
+    n_jobs = os.cpu_count() if args.n_jobs==-1 else args.n_jobs
+    logger.info('%d cohorts, %d worker processes', len(manifest['cohorts']), n_jobs)
+    for ind_cohort, name in enumerate(run_manifest(manifest, args.output_dir, n_jobs, args.cache_dir)):
+        logger.info('Cohort %s written (%d/%d)', name, ind_cohort + 1, len(manifest['cohorts']))
+
+
+if __name__ == '__main__':
+    main()
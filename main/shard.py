@@ -0,0 +1,76 @@
+"""Adaptive thresholds of one cohort split into shards, run on separate nodes and merged.
+
+    python -m main.shard run data.csv expgroup.csv --shard 0 --nb-shards 4 --random-state 0 --output shard_0.pkl
+    python -m main.shard merge shard_0.pkl shard_1.pkl shard_2.pkl shard_3.pkl --output-dir results
+
+data and expgroup are ';'-separated CSV files indexed by id_sample, as in data/; the
+tumoral samples are analysed. Eligible features are assigned to shards by a stable
+hash of their name, and every shard regenerates the same CV folds from the random
+state. --options takes a JSON object of further AdaptiveThreshold options, which must
+be the same for every shard. merge checks that the shards match, then writes
+adaptive_thresholds.csv and adaptive_details.csv to the output directory.
+"""
+import argparse
+import json
+import logging
+import os
+import pandas as pd
+from analysis import threshold
+from analysis.observer import LoggingObserver
+from service.data_consistency import DataConsistency
+
+logger = logging.getLogger('ectopy')
+
+
+def run_shard(data_path: str, expgroup_path: str, shard_index: int, nb_shards: int, random_state: int, output_path: str, options: dict = None) -> threshold.AdaptiveThreshold:
+    data = pd.read_csv(data_path, sep=';', index_col='id_sample')
+    expgroup = pd.read_csv(expgroup_path, sep=';', index_col='id_sample')
+    tumoral, expgroup_tumoral = DataConsistency().align_samples(data, expgroup[expgroup['group']=='tumoral'])
+    adaptive_threshold = threshold.AdaptiveThreshold(
+        data=tumoral, survival_data=expgroup_tumoral, shard_index=shard_index, nb_shards=nb_shards,
+        random_state=random_state, observer=LoggingObserver(), **(options or dict())
+        )
+    adaptive_threshold.calculate_threshold()
+    adaptive_threshold.write_shard(output_path)
+    return adaptive_threshold
+
+
+def write_merged_results(merged: dict, output_dir: str):
+    os.makedirs(output_dir, exist_ok=True)
+    thresholds = merged['thresholds'].rename('adaptive')
+    thresholds.index.name = 'feature'
+    thresholds.to_csv(os.path.join(output_dir, 'adaptive_thresholds.csv'), sep=';')
+    results = merged['results']
+    if len(results.features)>0:
+        details = pd.concat({feature: results.get_details(feature) for feature in results.features}, names=['feature', 'id_threshold'])
+        details.to_csv(os.path.join(output_dir, 'adaptive_details.csv'), sep=';')
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Sharded adaptive thresholds of a cohort')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='compute one shard')
+    run_parser.add_argument('data')
+    run_parser.add_argument('expgroup')
+    run_parser.add_argument('--shard', type=int, required=True, help='index of the shard, from 0')
+    run_parser.add_argument('--nb-shards', type=int, required=True)
+    run_parser.add_argument('--random-state', type=int, required=True, help='seed of the CV folds, the same for every shard')
+    run_parser.add_argument('--options', default='{}', help='JSON object of AdaptiveThreshold options')
+    run_parser.add_argument('--output', required=True, help='partial result file of the shard')
+    merge_parser = subparsers.add_parser('merge', help='check and combine the shard files')
+    merge_parser.add_argument('shards', nargs='+')
+    merge_parser.add_argument('--output-dir', default='results')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if args.command=='run':
+        run_shard(args.data, args.expgroup, args.shard, args.nb_shards, args.random_state, args.output, json.loads(args.options))
+        logger.info('Shard %d/%d written to %s', args.shard, args.nb_shards, args.output)
+    else:
+        merged = threshold.merge_shards(args.shards)
+        write_merged_results(merged, args.output_dir)
+        logger.info('%d shards merged: %d features written to %s', len(args.shards), len(merged['results'].features), args.output_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,76 @@
+import numpy as np
 import pandas as pd
 
 class DataConsistency:
-      
+    """Sample alignment of expression data and expgroup.
+
+    Input frames are never modified. Common samples are found with vectorised
+    index lookups and keep the order of the data; missing values are counted
+    chunk_size rows at a time, so no boolean copy of the whole matrix is made.
+    """
+
+    _chunk_size: int
+
+    def __init__(self, chunk_size: int = 1000):
+        self._chunk_size = chunk_size
+
+    def get_common_samples(self, samples: pd.Index, reference: pd.Index) -> pd.Index:
+        """Samples that are also in reference, in the order of samples"""
+        return samples[samples.isin(reference)]
+
+    def count_missing(self, data: pd.DataFrame, columns: pd.Index = None) -> tuple:
+        """(missing per row, missing per column) of data, or of its given columns, in one pass over the rows"""
+        columns = data.columns if columns is None else columns
+        column_positions = data.columns.get_indexer(columns)
+        missing_per_row = np.zeros(data.shape[0], dtype=np.int64)
+        missing_per_column = np.zeros(len(columns), dtype=np.int64)
+        for start in range(0, data.shape[0], self._chunk_size):
+            missing = pd.isna(data.iloc[start:start + self._chunk_size, column_positions].to_numpy())
+            missing_per_row[start:start + self._chunk_size] = missing.sum(axis=1)
+            missing_per_column += missing.sum(axis=0)
+        return pd.Series(missing_per_row, index=data.index), pd.Series(missing_per_column, index=columns)
+
     def check_sample_id (self, data: pd.DataFrame, expgroup: pd.DataFrame):
+        """Genes x samples data indexed by gene_symbol, without genes having missing sample values,
+        and expgroup without incomplete samples, both restricted to their common samples
+        in the order of the data columns. The data is copied once.
+        """
         if 'id_sample' in expgroup.columns:
-            expgroup.index = expgroup['id_sample']
-            expgroup = expgroup.drop(columns = ['id_sample'])
-
-        data.index = data['gene_symbol']
-        data = data.drop(columns=['gene_symbol'])
-        
-        expgroup=expgroup.dropna()
-        data=data.dropna()
-        common_samples = list(set(expgroup.index).intersection(set(data.columns)))
-        expgroup = expgroup.loc[common_samples,:]
-        data = data[common_samples]
-        
-        return data, expgroup
+            expgroup = expgroup.set_index('id_sample')
+        expgroup = expgroup.dropna()
+
+        sample_columns = data.columns.drop('gene_symbol')
+        missing_per_gene, _ = self.count_missing(data, sample_columns)
+        complete_genes = np.flatnonzero(missing_per_gene.to_numpy()==0)
+        common_samples = self.get_common_samples(sample_columns, expgroup.index)
+
+        aligned_data = data.iloc[complete_genes, data.columns.get_indexer(common_samples)]
+        aligned_data.index = pd.Index(data['gene_symbol'].to_numpy()[complete_genes], name='gene_symbol')
+        return aligned_data, expgroup.loc[common_samples, :]
+
+    def align_samples(self, data: pd.DataFrame, expgroup: pd.DataFrame) -> tuple:
+        """Samples x features data and expgroup restricted to their common samples, in the order of the data.
+
+        The data is returned as is when all its samples are in expgroup, otherwise copied once.
+        """
+        is_common = data.index.isin(expgroup.index)
+        common_samples = data.index[is_common]
+        aligned_data = data if is_common.all() else data.iloc[np.flatnonzero(is_common)]
+        return aligned_data, expgroup.loc[common_samples, :]
 
     def calculate_consistency_stats(self, data: pd.DataFrame, expgroup: pd.DataFrame) -> dict:
         stats = dict()
-        common_samples = list(set(expgroup.index).intersection(set(data.index)))
-        stats['expgroup'] = dict() 
-        stats['data'] = dict() 
+        common_samples = self.get_common_samples(data.index, expgroup.index)
+        missing_per_sample, missing_per_feature = self.count_missing(data)
+        stats['expgroup'] = dict()
+        stats['data'] = dict()
         stats['expgroup']['n_samples'] = expgroup.shape[0]
+        stats['expgroup']['n_missing'] = {column: int(nb_missing) for column, nb_missing in expgroup.isna().sum().items()}
         stats['data']['n_samples'] = data.shape[0]
+        stats['data']['n_features'] = data.shape[1]
+        stats['data']['n_missing'] = int(missing_per_sample.sum())
+        stats['data']['missing_per_sample'] = missing_per_sample
+        stats['data']['missing_per_feature'] = missing_per_feature
         stats['n_common_samples'] = len(common_samples)
-        stats['common_samples'] = common_samples
+        stats['common_samples'] = list(common_samples)
         return stats
@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+class ExpressionStore:
+    """Columnar binary copy of a samples x features expression CSV.
+
+    The store is a directory holding values.npy, a float32 features x samples
+    (gene-major) array, and index.json, the sample and feature labels. Values
+    are memory-mapped read-only on first access, so frames built from a store
+    only page in the genes that are actually read.
+    """
+
+    VALUES_FILE = 'values.npy'
+    INDEX_FILE = 'index.json'
+
+    _path: str
+    _index_name: str
+    _samples: pd.Index
+    _features: pd.Index
+    _values: np.ndarray
+
+    def __init__(self, path: str):
+        self._path = path
+        with open(os.path.join(path, self.INDEX_FILE)) as index_file:
+            index = json.load(index_file)
+        self._index_name = index['index_name']
+        self._samples = pd.Index(index['samples'], dtype=index['samples_dtype'], name=self._index_name)
+        self._features = pd.Index(index['features'])
+        self._values = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def samples(self) -> pd.Index:
+        return self._samples
+
+    @property
+    def features(self) -> pd.Index:
+        return self._features
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self._samples), len(self._features))
+
+    @property
+    def values(self) -> np.ndarray:
+        if self._values is None:
+            self._values = np.load(os.path.join(self._path, self.VALUES_FILE), mmap_mode='r')
+        return self._values
+
+    def to_frame(self, samples=None) -> pd.DataFrame:
+        """Samples x features frame on the memory map, copied only when samples are selected"""
+        if samples is None:
+            return pd.DataFrame(self.values.T, index=self._samples, columns=self._features, copy=False)
+        positions = self._samples.get_indexer(samples)
+        if np.any(positions<0):
+            raise KeyError('Samples not in store: ' + str(list(pd.Index(samples)[positions<0])))
+        return pd.DataFrame(self.values[:, positions].T, index=self._samples[positions], columns=self._features, copy=False)
+
+    def get_feature(self, feature) -> pd.Series:
+        return pd.Series(self.values[self._features.get_loc(feature)], index=self._samples, name=feature)
+
+    @classmethod
+    def convert(cls, csv_path: str, path: str, sep: str = ';', index_col: str = 'id_sample', chunksize: int = 1000) -> 'ExpressionStore':
+        """Stream a samples x features CSV into a new store, chunksize rows at a time"""
+        os.makedirs(path, exist_ok=True)
+        features = list(pd.read_csv(csv_path, sep=sep, index_col=index_col, nrows=0).columns)
+        # the sample labels are parsed as one column, as read_csv types them when reading the whole file
+        samples = pd.read_csv(csv_path, sep=sep, usecols=[index_col], index_col=index_col).index
+        nb_samples = len(samples)
+        # temporary files have unique names, so that processes converting the same store do not remove each other's
+        values_fd, values_tmp_path = tempfile.mkstemp(suffix='.tmp', dir=path)
+        os.close(values_fd)
+        values = np.lib.format.open_memmap(values_tmp_path, mode='w+', dtype=np.float32, shape=(len(features), nb_samples))
+        start = 0
+        for chunk in pd.read_csv(csv_path, sep=sep, index_col=index_col, chunksize=chunksize):
+            values[:, start:start + chunk.shape[0]] = chunk[features].to_numpy(dtype=np.float32).T
+            start = start + chunk.shape[0]
+        values.flush()
+        del values
+        os.replace(values_tmp_path, os.path.join(path, cls.VALUES_FILE))
+        index = {
+            'index_name': index_col, 'samples': samples.tolist(), 'samples_dtype': str(samples.dtype), 
+            'features': features, 'source': os.path.abspath(csv_path)
+            }
+        index_fd, index_tmp_path = tempfile.mkstemp(suffix='.tmp', dir=path)
+        with os.fdopen(index_fd, 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(index_tmp_path, os.path.join(path, cls.INDEX_FILE))
+        return cls(path)
+
+    @classmethod
+    def is_up_to_date(cls, csv_path: str, path: str) -> bool:
+        index_path = os.path.join(path, cls.INDEX_FILE)
+        if not os.path.exists(index_path) or not os.path.exists(os.path.join(path, cls.VALUES_FILE)):
+            return False
+        if os.path.getmtime(index_path)<os.path.getmtime(csv_path):
+            return False
+        with open(index_path) as index_file:
+            return 'samples_dtype' in json.load(index_file) # stores from before the sample dtype was kept are converted again
+
+
+def load_expression(csv_path: str, cache_dir: str = None, sep: str = ';', index_col: str = 'id_sample') -> pd.DataFrame:
+    """Expression frame of a CSV, converted once to a store and memory-mapped afterwards"""
+    if cache_dir is None:
+        cache_dir = os.path.splitext(csv_path)[0] + '.store'
+    if not ExpressionStore.is_up_to_date(csv_path, cache_dir):
+        ExpressionStore.convert(csv_path, cache_dir, sep=sep, index_col=index_col)
+    return ExpressionStore(cache_dir).to_frame()
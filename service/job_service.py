@@ -0,0 +1,300 @@
+"""Local asyncio service running threshold and frequency jobs, with a result cache.
+
+A job is a JSON-able dict:
+
+    {"type": "frequency" or "adaptive", "data": "data.csv", "expgroup": "expgroup.csv", "options": {...}}
+
+with data and expgroup ';'-separated CSV files indexed by id_sample, as in data/.
+"frequency" jobs give the m2sd and max-normal thresholds of the normal samples with
+the activation frequencies in the tumoral samples; "adaptive" jobs give the
+AdaptiveThreshold details of every eligible feature (options are passed to it).
+
+Jobs are keyed by their content: type, options and a fingerprint of the input files.
+Identical jobs submitted while one is running wait for it instead of starting again,
+and finished results are served from a ResultStore. Adaptive jobs are only stored
+with an integer random_state option: without it, their CV folds change on every run.
+Jobs run on a process pool with at most max_concurrency of them at once; file hashing
+and result (un)pickling run in threads, off the event loop.
+
+JobServer exposes a JobService on localhost with one JSON object per line:
+{"id": ..., "job": {...}} is answered by {"id": ..., "key": ..., "status": ..., "result": ...},
+the result being the frame in pandas 'split' orientation. JobClient is the matching client.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from service.result_store import ResultStore
+
+
+JOB_TYPES = ('frequency', 'adaptive')
+
+
+# === Jobs, run in the worker processes ===
+
+def _read_cohort(job: dict) -> tuple:
+    from service.data_consistency import DataConsistency
+    data = pd.read_csv(job['data'], sep=';', index_col='id_sample')
+    expgroup = pd.read_csv(job['expgroup'], sep=';', index_col='id_sample')
+    data_consistency = DataConsistency()
+    normal, _ = data_consistency.align_samples(data, expgroup[expgroup['group']=='normal'])
+    tumoral, expgroup_tumoral = data_consistency.align_samples(data, expgroup[expgroup['group']=='tumoral'])
+    return normal, tumoral, expgroup_tumoral
+
+
+def run_job(job: dict) -> pd.DataFrame:
+    from analysis import threshold, expression_analysis
+    normal, tumoral, expgroup_tumoral = _read_cohort(job)
+    options = job.get('options', dict())
+    if job['type']=='frequency':
+        thresholds = pd.DataFrame({
+            'm2sd': threshold.StdDecorator(threshold.MeanTreshold(normal), nb_std=2).calculate_threshold(),
+            'max_normal': threshold.MaxTreshold(normal).calculate_threshold()
+            })
+        frequencies = expression_analysis.ExpressionFrequency().calculate_expression_frequencies(tumoral, thresholds)
+        return pd.concat({'threshold': thresholds, 'frequency': frequencies}, axis=1)
+    adaptive_threshold = threshold.AdaptiveThreshold(data=tumoral, survival_data=expgroup_tumoral, **options)
+    adaptive_threshold.calculate_threshold()
+    return pd.concat({feature: adaptive_threshold.get_details(feature) for feature in adaptive_threshold.eligible_features}, names=['feature', 'id_threshold'])
+
+
+# === Service ===
+
+class JobService:
+
+    _result_store: ResultStore
+    _max_workers: int
+    _executor: ProcessPoolExecutor
+    _semaphore: asyncio.Semaphore
+    _in_flight: dict # {key: asyncio.Future}
+    _fingerprints: dict # {(path, mtime, size): content hash}
+    _statistics: dict # {'nb_submitted', 'nb_computed', 'nb_cache_hits', 'nb_deduplicated', 'nb_failed'}
+
+    def __init__(self, result_store: ResultStore, max_workers: int = None, max_concurrency: int = None):
+        self._result_store = result_store
+        self._max_workers = os.cpu_count() if max_workers is None else max_workers
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(self._max_workers if max_concurrency is None else max_concurrency)
+        self._in_flight = dict()
+        self._fingerprints = dict()
+        self._statistics = dict.fromkeys(['nb_submitted', 'nb_computed', 'nb_cache_hits', 'nb_deduplicated', 'nb_failed'], 0)
+
+    @property
+    def statistics(self) -> dict:
+        return self._statistics
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _get_file_fingerprint(self, path: str) -> str:
+        """Hash of a file content, recomputed only when its modification time or size changes"""
+        file_stat = os.stat(path)
+        file_key = (os.path.abspath(path), file_stat.st_mtime_ns, file_stat.st_size)
+        if file_key not in self._fingerprints:
+            file_hash = hashlib.blake2b(digest_size=16)
+            with open(path, 'rb') as input_file:
+                for block in iter(lambda: input_file.read(1 << 20), b''):
+                    file_hash.update(block)
+            self._fingerprints[file_key] = file_hash.hexdigest()
+        return self._fingerprints[file_key]
+
+    def is_cacheable(self, job: dict) -> bool:
+        """Whether the result of a job is reproducible, hence stored and served from the ResultStore"""
+        if job['type']!='adaptive':
+            return True
+        random_state = job.get('options', dict()).get('random_state')
+        return isinstance(random_state, int) and not isinstance(random_state, bool)
+
+    def get_job_key(self, job: dict) -> str:
+        if job.get('type') not in JOB_TYPES:
+            raise ValueError('Unknown job type: ' + str(job.get('type')))
+        description = {
+            'type': job['type'],
+            'options': job.get('options', dict()),
+            'data': self._get_file_fingerprint(job['data']),
+            'expgroup': self._get_file_fingerprint(job['expgroup'])
+            }
+        return hashlib.blake2b(json.dumps(description, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    async def submit(self, job: dict) -> tuple:
+        """(key, status, result) of a job, status being 'computed', 'cached' or 'deduplicated'"""
+        self._statistics['nb_submitted'] += 1
+        key = await asyncio.to_thread(self.get_job_key, job)
+        if key in self._in_flight:
+            self._statistics['nb_deduplicated'] += 1
+            return (key, 'deduplicated', await asyncio.shield(self._in_flight[key]))
+        # registered before the store lookup, so that identical jobs wait for this one
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            is_cacheable = self.is_cacheable(job)
+            result = await asyncio.to_thread(self._result_store.get, key) if is_cacheable else None
+            if result is not None:
+                self._statistics['nb_cache_hits'] += 1
+                status = 'cached'
+            else:
+                result = await self._run(job)
+                if is_cacheable:
+                    await asyncio.to_thread(self._result_store.put, key, result)
+                self._statistics['nb_computed'] += 1
+                status = 'computed'
+            future.set_result(result)
+        except Exception as error:
+            self._statistics['nb_failed'] += 1
+            future.set_exception(error)
+            future.exception() # retrieved here, so that jobs without waiters do not log it
+            raise
+        finally:
+            del self._in_flight[key]
+        return (key, status, result)
+
+    async def _run(self, job: dict) -> pd.DataFrame:
+        async with self._semaphore:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self._max_workers)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, run_job, job)
+
+
+# === Localhost server and client ===
+
+class JobServer:
+
+    _service: JobService
+    _host: str
+    _port: int
+    _server: asyncio.AbstractServer
+    _connections: set # handler tasks of the open connections
+
+    def __init__(self, service: JobService, host: str = '127.0.0.1', port: int = 0):
+        self._service = service
+        self._host = host
+        self._port = port
+        self._server = None
+        self._connections = set()
+
+    @property
+    def port(self) -> int:
+        """Listening port, chosen by the system when 0 was given"""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self._host, self._port)
+
+    async def stop(self):
+        self._server.close()
+        for connection in list(self._connections):
+            connection.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # requests of a connection run concurrently, responses are written as they complete
+        write_lock = asyncio.Lock()
+        tasks = set()
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._handle_request(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # server stopped: pending requests are dropped, the connection closes cleanly
+            for task in tasks:
+                task.cancel()
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _handle_request(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        response = dict()
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            key, status, result = await self._service.submit(request['job'])
+            response.update({'key': key, 'status': status, 'result': json.loads(result.to_json(orient='split'))})
+        except Exception as error:
+            response.update({'status': 'error', 'error': type(error).__name__ + ': ' + str(error)})
+        async with write_lock:
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+
+class JobClient:
+    """Client of a JobServer; submit can be awaited concurrently on one connection"""
+
+    _host: str
+    _port: int
+    _reader: asyncio.StreamReader
+    _writer: asyncio.StreamWriter
+    _pending: dict # {request id: asyncio.Future}
+    _next_id: int
+    _listener: asyncio.Task
+
+    def __init__(self, port: int, host: str = '127.0.0.1'):
+        self._host = host
+        self._port = port
+        self._pending = dict()
+        self._next_id = 0
+
+    async def __aenter__(self):
+        self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        self._listener = asyncio.ensure_future(self._listen())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._listener.cancel()
+
+    async def _listen(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            self._pending.pop(response['id']).set_result(response)
+        for future in self._pending.values():
+            future.set_exception(ConnectionError('Job server closed the connection'))
+
+    async def submit(self, job: dict) -> tuple:
+        """(status, result frame) of a job; raises RuntimeError when the job failed"""
+        self._next_id = self._next_id + 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        self._writer.write(json.dumps({'id': self._next_id, 'job': job}).encode() + b'\n')
+        await self._writer.drain()
+        response = await future
+        if response['status']=='error':
+            raise RuntimeError(response['error'])
+        return (response['status'], _read_split_frame(response['result']))
+
+
+def _read_split_frame(result: dict) -> pd.DataFrame:
+    """Frame of a to_json(orient='split') result, with its MultiIndex axes rebuilt"""
+    def read_axis(labels: list) -> pd.Index:
+        if len(labels)>0 and isinstance(labels[0], list):
+            return pd.MultiIndex.from_tuples([tuple(label) for label in labels])
+        return pd.Index(labels)
+    return pd.DataFrame(result['data'], index=read_axis(result['index']), columns=read_axis(result['columns']))
@@ -0,0 +1,44 @@
+import os
+import pandas as pd
+
+
+class ResultStore:
+    """On-disk store of per-feature results, addressed by content keys.
+
+    Each entry is a pickled DataFrame written to a temporary file and renamed,
+    so an interrupted run never leaves a partial entry behind.
+    """
+
+    _path: str
+
+    def __init__(self, path: str):
+        self._path = path
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _get_file(self, key: str) -> str:
+        return os.path.join(self._path, key[:2], key + '.pkl')
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._get_file(key))
+
+    def get(self, key: str) -> pd.DataFrame:
+        if key not in self:
+            return None
+        return pd.read_pickle(self._get_file(key))
+
+    def put(self, key: str, result: pd.DataFrame):
+        result_file = self._get_file(key)
+        os.makedirs(os.path.dirname(result_file), exist_ok=True)
+        result.to_pickle(result_file + '.tmp')
+        os.replace(result_file + '.tmp', result_file)
+
+    def keys(self) -> list:
+        keys = []
+        for directory in sorted(os.listdir(self._path)):
+            if os.path.isdir(os.path.join(self._path, directory)):
+                keys.extend(sorted(name[:-4] for name in os.listdir(os.path.join(self._path, directory)) if name.endswith('.pkl')))
+        return keys
@@ -0,0 +1,24 @@
+"""Synthetic cohort and result comparisons shared by the AdaptiveThreshold tests"""
+from analysis import threshold
+from benchmark.synthetic import generate_cohort
+import pandas as pd
+
+NUMPY_LOGRANK = {'survival_type': 'logrank', 'survival_backend': 'numpy'} # fast backend of most tests
+
+
+def get_cohort(nb_genes: int = 10, nb_samples: int = 300, nb_normal_samples: int = 0, random_state: int = 0) -> tuple:
+    """(data, expgroup) of a synthetic cohort, tumoral samples only by default"""
+    return generate_cohort(nb_genes=nb_genes, nb_samples=nb_samples, nb_normal_samples=nb_normal_samples, random_state=random_state)
+
+
+def run_adaptive_threshold(data: pd.DataFrame, expgroup: pd.DataFrame, **options) -> tuple:
+    """(AdaptiveThreshold, thresholds) of a finished run"""
+    adaptive_threshold = threshold.AdaptiveThreshold(data, expgroup, **options)
+    return adaptive_threshold, adaptive_threshold.calculate_threshold()
+
+
+def assert_same_results(adaptive_threshold: threshold.AdaptiveThreshold, thresholds: pd.Series, expected: threshold.AdaptiveThreshold, expected_thresholds: pd.Series):
+    """Same thresholds and same details for every eligible feature"""
+    pd.testing.assert_series_equal(thresholds, expected_thresholds)
+    for feature in expected.eligible_features:
+        pd.testing.assert_frame_equal(adaptive_threshold.get_details(feature), expected.get_details(feature))
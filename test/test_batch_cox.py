@@ -0,0 +1,31 @@
+from analysis import survival
+import numpy as np
+import pandas as pd
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+tumoral = data.loc[expgroup_tumoral.index, :]
+
+options = {'survival_data': expgroup_tumoral, 'duration_col': 'time', 'event_col': 'event'}
+lifelines_model = survival.Cox(**options, backend='lifelines')
+numpy_model = survival.Cox(**options, backend='numpy')
+
+for feature in tumoral.columns:
+    thresholds = tumoral[feature].quantile(np.arange(0.15, 0.86, 0.01)).to_numpy()
+    expected = np.array(lifelines_model.calculate_model_for_thresholds(feature, thresholds, tumoral))
+    batched = np.array(numpy_model.calculate_model_for_thresholds(feature, thresholds, tumoral))
+    pvalue_error = np.abs(batched[:, 0] - expected[:, 0]).max()
+    hr_error = (np.abs(batched[:, 1] - expected[:, 1]) / expected[:, 1]).max()
+    print(feature, 'max absolute error p-value', pvalue_error, 'max relative error hr', hr_error)
+    assert pvalue_error<1e-3 and hr_error<1e-4
+
+# continuous expression, with the risk set of the cohort built once
+for feature in tumoral.columns:
+    expected = lifelines_model.calculate_model_for_expression(feature, tumoral)
+    fitted = numpy_model.calculate_model_for_expression(feature, tumoral)
+    print(feature, 'expression', expected, fitted)
+    assert abs(fitted[0] - expected[0])<1e-3 and abs(fitted[1] - expected[1]) / expected[1]<1e-4
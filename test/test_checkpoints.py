@@ -0,0 +1,50 @@
+from analysis import threshold
+from analysis.observer import ThresholdObserver
+from service.result_store import ResultStore
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold, assert_same_results
+import tempfile
+import pandas as pd
+
+
+class CheckpointObserver(ThresholdObserver):
+
+    def __init__(self):
+        self.nb_checkpoints = None
+        self.features = []
+
+    def on_run_start(self, nb_features: int, nb_checkpoints: int):
+        self.nb_checkpoints = nb_checkpoints
+
+    def on_feature(self, feature, timings: dict, statistics: dict, details: pd.DataFrame):
+        self.features.append(feature)
+
+
+data, expgroup = get_cohort(nb_genes=10, nb_samples=200)
+options = dict(NUMPY_LOGRANK, random_state=0)
+
+with tempfile.TemporaryDirectory() as directory:
+    result_store = ResultStore(directory)
+    first, first_thresholds = run_adaptive_threshold(data, expgroup, result_store=result_store, **options)
+
+    # a resumed run loads every feature from the store
+    observer = CheckpointObserver()
+    resumed, resumed_thresholds = run_adaptive_threshold(data, expgroup, result_store=result_store, observer=observer, **options)
+    print('\nResumed run:', observer.nb_checkpoints, 'features loaded from checkpoints, computed', observer.features)
+    assert observer.nb_checkpoints==len(first.eligible_features) and observer.features==[]
+    assert_same_results(resumed, resumed_thresholds, first, first_thresholds)
+
+    # only the changed gene is computed again
+    changed = data.copy()
+    changed['G3'] = changed['G3'] * 1.5
+    observer = CheckpointObserver()
+    rerun, rerun_thresholds = run_adaptive_threshold(changed, expgroup, result_store=result_store, observer=observer, **options)
+    print('Changed G3:', observer.nb_checkpoints, 'features loaded from checkpoints, computed', observer.features)
+    assert observer.features==['G3'] and observer.nb_checkpoints==len(rerun.eligible_features) - 1
+    assert_same_results(rerun, rerun_thresholds, *run_adaptive_threshold(changed, expgroup, **options))
+
+    # without a fixed random_state, folds and keys would change at every run
+    try:
+        threshold.AdaptiveThreshold(data, expgroup, result_store=result_store, **NUMPY_LOGRANK)
+        raise AssertionError('A result_store was accepted without an integer random_state')
+    except ValueError as error:
+        print('Refused:', error)
@@ -0,0 +1,59 @@
+from main import cli
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+
+data_dir = os.path.abspath('../data/')
+
+with tempfile.TemporaryDirectory() as directory:
+    # two cohorts sharing one expression matrix, converted once to a store shared by the workers
+    manifest = {
+        'options': {},
+        'cohorts': [
+            {'name': name, 'data': os.path.join(data_dir, 'data.csv'), 'expgroup': os.path.join(data_dir, 'expgroup.csv')}
+            for name in ['A', 'B']
+            ]
+        }
+    manifest_path = os.path.join(directory, 'manifest.json')
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    environment = dict(os.environ, PYTHONPATH=os.path.abspath('..'))
+    cache_dir = os.path.join(directory, 'cache')
+    for output_dir, arguments in [('cached', ['--n-jobs', '2', '--cache-dir', cache_dir]), ('csv', ['--n-jobs', '1'])]:
+        subprocess.run([sys.executable, '-m', 'main.cli', manifest_path, '--output-dir', os.path.join(directory, output_dir), *arguments], env=environment, check=True)
+
+    print('\nCache', os.listdir(cache_dir))
+    assert len(os.listdir(cache_dir))==1
+    assert not any(name.endswith('.tmp') for name in os.listdir(os.path.join(cache_dir, os.listdir(cache_dir)[0])))
+    for name in ['A', 'B']:
+        for table in ['thresholds.csv', 'frequencies.csv']:
+            cached = pd.read_csv(os.path.join(directory, 'cached', name, table), sep=';', index_col=0)
+            expected = pd.read_csv(os.path.join(directory, 'csv', name, table), sep=';', index_col=0)
+            pd.testing.assert_frame_equal(cached, expected, rtol=1e-6)
+        with open(os.path.join(directory, 'cached', name, 'consistency.json')) as consistency_file:
+            consistency = json.load(consistency_file)
+        print(name, consistency['n_common_samples'], 'common samples')
+        assert consistency['n_common_samples']>0
+
+    # a worker keeps at most max_worker_expressions expression matrices, the least recently used dropped first
+    paths = [os.path.join(directory, 'data_' + str(i) + '.csv') for i in range(3)]
+    for path in paths:
+        pd.read_csv(os.path.join(data_dir, 'data.csv'), sep=';', index_col='id_sample').iloc[:20].to_csv(path, sep=';')
+    for path in paths + paths[1:2]:
+        cli._load_table(path, expression=True)
+    print('Worker expressions', [os.path.basename(path) for path, _ in cli._worker_expressions])
+    assert list(cli._worker_expressions)==[(paths[2], None), (paths[1], None)]
+    assert cli._load_table(os.path.join(data_dir, 'expgroup.csv')) is cli._load_table(os.path.join(data_dir, 'expgroup.csv'))
+
+    # duplicate cohort names are refused
+    manifest['cohorts'][1]['name'] = 'A'
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    try:
+        cli.read_manifest(manifest_path)
+        raise AssertionError('A manifest with duplicate cohorts was accepted')
+    except ValueError as error:
+        print('Refused:', error)
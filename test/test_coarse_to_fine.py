@@ -0,0 +1,29 @@
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold
+
+data, expgroup = get_cohort(nb_genes=20, nb_samples=400)
+options = dict(NUMPY_LOGRANK, step_percentile=0.5, nb_cross_validations=2, random_state=0)
+
+grid, grid_thresholds = run_adaptive_threshold(data, expgroup, **options)
+coarse_to_fine, coarse_to_fine_thresholds = run_adaptive_threshold(data, expgroup, search='coarse_to_fine', coarse_factor=5, **options)
+
+statistics = coarse_to_fine.statistics
+nb_fits = statistics['nb_threshold_fits'] + statistics['nb_fits']
+nb_fits_grid = grid.statistics['nb_threshold_fits'] + grid.statistics['nb_fits']
+print('\nFits: coarse-to-fine', nb_fits, 'grid', nb_fits_grid)
+assert statistics['nb_threshold_fits'] + statistics['nb_threshold_fits_skipped']==grid.statistics['nb_threshold_fits']
+assert nb_fits<nb_fits_grid
+
+# same optimum for every feature whose validated runs all span the coarse step
+for feature in grid.eligible_features:
+    validated = grid.get_details(feature)['validated'].to_numpy()
+    run_lengths = []
+    run_length = 0
+    for is_validated in list(validated) + [False]:
+        if is_validated:
+            run_length = run_length + 1
+        elif run_length>0:
+            run_lengths.append(run_length)
+            run_length = 0
+    if min(run_lengths, default=5)>=5:
+        assert grid_thresholds[feature]==coarse_to_fine_thresholds[feature] or (grid_thresholds.isna()[feature] and coarse_to_fine_thresholds.isna()[feature])
+        assert (coarse_to_fine.get_details(feature)['validated']==grid.get_details(feature)['validated']).all()
@@ -1,5 +1,7 @@
 from analysis import threshold
+from analysis.observer import LoggingObserver
 import pandas as pd
+import logging
 
 data_dir = '../data/'
 
@@ -31,7 +33,8 @@ options = {
     }
 
 
-adaptive_threshold = threshold.AdaptiveThreshold(data=tumoral, survival_data=expgroup_tumoral, duration_col='time', event_col='event', **options)
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+adaptive_threshold = threshold.AdaptiveThreshold(data=tumoral, survival_data=expgroup_tumoral, duration_col='time', event_col='event', observer=LoggingObserver(), **options)
 adaptive = adaptive_threshold.calculate_threshold()
 print(list(adaptive))
 print(adaptive_threshold.get_details('EXO1').head(15))
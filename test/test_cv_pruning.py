@@ -0,0 +1,26 @@
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold
+import numpy as np
+import pandas as pd
+
+data, expgroup = get_cohort(nb_genes=10)
+options = dict(NUMPY_LOGRANK, nb_cross_validations=10, random_state=0)
+
+full, full_thresholds = run_adaptive_threshold(data, expgroup, **options)
+
+# pruning skips fits without changing the optimum
+pruned, pruned_thresholds = run_adaptive_threshold(data, expgroup, cv_pruning=True, **options)
+print('\nPruning:', pruned.statistics['nb_fits'], 'fits instead of', full.statistics['nb_fits'], pruned.statistics['nb_fits_skipped'], 'skipped')
+assert pruned.statistics['nb_fits_skipped']>0
+pd.testing.assert_series_equal(pruned_thresholds, full_thresholds)
+
+# adaptive repeats stop early at the default precision, scores stay within its half-width
+adaptive, adaptive_thresholds = run_adaptive_threshold(data, expgroup, cv_adaptive_repeats=True, **options)
+cv_ci_half_width = 15.0
+print('Adaptive repeats:', adaptive.statistics['nb_early_stops'], 'early stops', adaptive.statistics['nb_fits_skipped'], 'fits skipped')
+print('Optimal thresholds changed:', int((adaptive_thresholds!=full_thresholds).sum()), 'of', len(full_thresholds))
+assert adaptive.statistics['nb_early_stops']>0
+for feature in full.eligible_features:
+    scores = adaptive.get_details(feature)['cv_score'].to_numpy()
+    full_scores = full.get_details(feature)['cv_score'].to_numpy()
+    assert np.array_equal(np.isnan(scores), np.isnan(full_scores))
+    assert np.all(np.abs(scores - full_scores)[~np.isnan(scores)]<=cv_ci_half_width)
@@ -0,0 +1,61 @@
+from service.data_consistency import DataConsistency
+import numpy as np
+import pandas as pd
+
+rng = np.random.default_rng(0)
+samples = ['S' + str(i) for i in range(12)]
+data = pd.DataFrame(rng.normal(size=(8, len(samples))), columns=samples)
+data.iloc[1, 3] = np.nan
+data.iloc[5, 10] = np.nan
+data.insert(0, 'gene_symbol', ['G' + str(i) for i in range(7)] + [np.nan])
+expgroup = pd.DataFrame({
+    'id_sample': ['S11', 'S2', 'S3', 'S5', 'S7', 'S0', 'X1'],
+    'group': ['tumoral', 'tumoral', None, 'normal', 'tumoral', 'normal', 'tumoral'],
+    'time': [1.0, 2.0, 3.0, np.nan, 5.0, 6.0, 7.0]
+    })
+data_copy, expgroup_copy = data.copy(), expgroup.copy()
+
+
+def check_sample_id_with_sets(data: pd.DataFrame, expgroup: pd.DataFrame) -> tuple:
+    """Former implementation, on copies: set intersection of the samples"""
+    data, expgroup = data.copy(), expgroup.copy()
+    expgroup.index = expgroup['id_sample']
+    expgroup = expgroup.drop(columns=['id_sample'])
+    data.index = data['gene_symbol']
+    data = data.drop(columns=['gene_symbol'])
+    expgroup = expgroup.dropna()
+    data = data.dropna()
+    common_samples = list(set(expgroup.index).intersection(set(data.columns)))
+    return data[common_samples], expgroup.loc[common_samples, :]
+
+
+data_consistency = DataConsistency(chunk_size=3)
+aligned_data, aligned_expgroup = data_consistency.check_sample_id(data, expgroup)
+print('\nAligned data')
+print(aligned_data)
+print(aligned_expgroup)
+
+# inputs are not modified
+pd.testing.assert_frame_equal(data, data_copy)
+pd.testing.assert_frame_equal(expgroup, expgroup_copy)
+
+# same genes and samples as the set implementation, samples in the order of the data
+expected_data, expected_expgroup = check_sample_id_with_sets(data, expgroup)
+data_order = [sample for sample in data.columns if sample in expected_data.columns]
+assert list(aligned_data.columns)==data_order==['S0', 'S2', 'S7', 'S11']
+pd.testing.assert_frame_equal(aligned_data, expected_data[data_order], check_names=False)
+pd.testing.assert_frame_equal(aligned_expgroup, expected_expgroup.loc[data_order], check_names=False)
+
+# samples x features alignment keeps the data order and returns the data itself when complete
+samples_data = aligned_data.T
+subset, subset_expgroup = data_consistency.align_samples(samples_data, aligned_expgroup.iloc[::-1])
+assert subset is samples_data and list(subset_expgroup.index)==list(samples_data.index)
+subset, subset_expgroup = data_consistency.align_samples(samples_data, aligned_expgroup.iloc[1:])
+assert list(subset.index)==list(subset_expgroup.index)==['S2', 'S7', 'S11']
+
+# missing counts, chunk by chunk
+sample_values = data.drop(columns=['gene_symbol'])
+missing_per_row, missing_per_column = data_consistency.count_missing(sample_values)
+assert missing_per_row.equals(sample_values.isna().sum(axis=1))
+assert missing_per_column.equals(sample_values.isna().sum(axis=0))
+assert missing_per_row.sum()==2 and missing_per_column['S3']==1 and missing_per_column['S10']==1
@@ -0,0 +1,45 @@
+from analysis import threshold, expression_analysis
+import numpy as np
+import pandas as pd
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+
+normal = data.loc[expgroup[expgroup['group']=='normal'].index, :]
+tumoral = data.loc[expgroup[expgroup['group']=='tumoral'].index, :]
+
+thresholds = {
+    'm2sd': threshold.StdDecorator(threshold.MeanTreshold(normal), nb_std=2).calculate_threshold(),
+    'max_normal': threshold.MaxTreshold(normal).calculate_threshold(),
+    'p95_tumoral': threshold.PercentileThreshold(tumoral, 95.0).calculate_threshold(),
+    }
+
+expression_frequency = expression_analysis.ExpressionFrequency()
+frequencies = expression_frequency.calculate_expression_frequencies(tumoral, thresholds)
+print('\nActivation frequency in percentage')
+print(frequencies.head())
+
+for name, threshold_values in thresholds.items():
+    frequency = expression_frequency.calculate_expression_frequency(tumoral, threshold_values)
+    assert np.allclose(frequencies[name], frequency, rtol=0, atol=1e-12)
+
+expressed = expression_frequency.define_packed_expressed_samples(tumoral, thresholds)
+print('\nPacked masks', expressed.packed.shape, expressed.packed.nbytes, 'bytes')
+assert expressed.get_expressed_samples('m2sd').equals(expression_frequency.define_expressed_samples(tumoral, thresholds['m2sd']))
+assert np.allclose(100.0 * expressed.count_expressed() / tumoral.shape[0], frequencies)
+assert np.array_equal(expressed.count_expressed()['m2sd'].to_numpy(), expression_frequency.define_expressed_samples(tumoral, thresholds['m2sd']).sum().to_numpy())
+# features packed by chunks in their own dtype, as read from a float32 store
+tumoral_float32 = tumoral.astype(np.float32)
+expressed_float32 = expression_frequency.define_packed_expressed_samples(tumoral_float32, thresholds, chunk_size=7)
+assert expressed_float32.get_expressed_samples('m2sd').equals(expression_frequency.define_expressed_samples(tumoral_float32.astype(float), thresholds['m2sd']))
+assert np.array_equal(expression_frequency.define_packed_expressed_samples(tumoral, thresholds, chunk_size=7).packed, expressed.packed)
+# lookup table used without numpy.bitwise_count
+assert np.array_equal(expression_analysis._BIT_COUNTS[expressed.packed], np.unpackbits(expressed.packed[..., None], axis=-1).sum(axis=-1))
+
+coactivation = expressed.count_coactivation('m2sd', chunk_size=64)
+mask = expression_frequency.define_expressed_samples(tumoral, thresholds['m2sd']).astype(int)
+print('\nCo-activation with m2sd threshold')
+print(coactivation.iloc[:5, :5])
+assert np.array_equal(coactivation.to_numpy(), (mask.T @ mask).to_numpy())
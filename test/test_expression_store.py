@@ -0,0 +1,63 @@
+from service.expression_store import ExpressionStore, load_expression
+from analysis import threshold
+from analysis.sorted_index import SortedIndex
+from service.data_consistency import DataConsistency
+import numpy as np
+import pandas as pd
+import os
+import tempfile
+
+data_dir = '../data/'
+
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    store = ExpressionStore.convert(data_dir + 'data.csv', cache_dir, chunksize=100)
+    print('Store', store.shape, store.values.dtype)
+    assert store.shape==data.shape
+    
+    assert np.shares_memory(store.to_frame()['EXO1'].to_numpy(), store.values)
+    
+    mapped = load_expression(data_dir + 'data.csv', cache_dir=cache_dir)
+    print(mapped.head())
+    assert np.array_equal(mapped.to_numpy(), data.to_numpy(dtype=np.float32))
+    assert list(mapped.index)==list(data.index)
+    
+    normal = store.to_frame(expgroup[expgroup['group']=='normal'].index)
+    m2sd_threshold = threshold.StdDecorator(threshold.MeanTreshold(normal), nb_std=2).calculate_threshold()
+    print(m2sd_threshold)
+    
+    # sorted columns are built block by block from the memory map, within the cache size
+    sorted_index = SortedIndex(mapped, block_size=1, cache_size=2 * mapped.shape[0])
+    pd.testing.assert_series_equal(sorted_index.quantile(0.85), mapped.quantile(0.85))
+    pd.testing.assert_series_equal(sorted_index.nth_value(20, ascending=False), mapped.apply(lambda values: values.sort_values().iloc[-20]).astype(float))
+    print('Sorted values cached', sorted_index.nb_cached_values, 'of', mapped.size)
+    assert sorted_index.nb_cached_values<=2 * mapped.shape[0]
+    del mapped, normal, store, sorted_index
+
+# numeric sample ids keep the dtype read_csv gives them, so that they still match the expgroup
+with tempfile.TemporaryDirectory() as directory:
+    numeric = data.iloc[:50].copy()
+    numeric.index = pd.Index(np.arange(101, 151), name='id_sample')
+    numeric_expgroup = expgroup.iloc[:50].copy()
+    numeric_expgroup.index = numeric.index
+    numeric.to_csv(directory + '/numeric.csv', sep=';')
+    numeric_expgroup.to_csv(directory + '/numeric_expgroup.csv', sep=';')
+    mapped = load_expression(directory + '/numeric.csv', cache_dir=directory + '/store')
+    expected_index = pd.read_csv(directory + '/numeric.csv', sep=';', index_col='id_sample').index
+    print('Numeric sample ids', mapped.index.dtype, list(mapped.index[:3]))
+    pd.testing.assert_index_equal(mapped.index, expected_index)
+    aligned, _ = DataConsistency().align_samples(mapped, pd.read_csv(directory + '/numeric_expgroup.csv', sep=';', index_col='id_sample'))
+    assert aligned.shape[0]==50
+    del mapped, aligned
+
+# processes converting the same store at once each write their own temporary files
+if __name__ == '__main__':
+    from concurrent.futures import ProcessPoolExecutor
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            stores = list(executor.map(ExpressionStore.convert, [data_dir + 'data.csv'] * 4, [cache_dir] * 4))
+        print('Concurrent conversions', [store.shape for store in stores])
+        assert all(store.shape==data.shape for store in stores)
+        assert sorted(os.listdir(cache_dir))==[ExpressionStore.INDEX_FILE, ExpressionStore.VALUES_FILE]
@@ -0,0 +1,46 @@
+import subprocess
+import sys
+
+# Import cost of the simple-threshold path (main/main.py) in a fresh interpreter, relative to the
+# numpy and pandas imports it needs anyway: best of nb_runs, so that a loaded machine does not fail it
+relative_budget = 0.5
+nb_runs = 5
+heavy_modules = ['lifelines', 'sklearn', 'scipy', 'matplotlib']
+
+script = '''
+import sys, time
+start = time.perf_counter()
+import numpy, pandas
+middle = time.perf_counter()
+from analysis import threshold, expression_analysis
+from service.data_consistency import DataConsistency
+print(middle - start, time.perf_counter() - middle)
+print(' '.join(sorted(name for name in sys.modules if name.split('.')[0] in %r)))
+''' % (heavy_modules,)
+
+baseline_times = []
+import_times = []
+for _ in range(nb_runs):
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout.splitlines()
+    baseline_time, import_time = [float(value) for value in output[0].split()]
+    baseline_times.append(baseline_time)
+    import_times.append(import_time)
+    loaded = output[1].split() if len(output)>1 else []
+    assert len(loaded)==0, loaded
+print('Import time of the simple-threshold path', round(min(import_times), 3), 's, numpy and pandas', round(min(baseline_times), 3), 's')
+print('Heavy modules loaded', loaded)
+assert min(import_times)<relative_budget * min(baseline_times)
+
+# heavy dependencies are loaded once an AdaptiveThreshold is built
+script = '''
+import sys
+import pandas as pd
+from analysis import threshold
+data_dir = '../data/'
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+threshold.AdaptiveThreshold(data=data.loc[expgroup_tumoral.index, :], survival_data=expgroup_tumoral)
+print('sklearn' in sys.modules)
+'''
+assert subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout.strip()=='True'
@@ -0,0 +1,49 @@
+from service.job_service import JobService, JobServer, JobClient
+from service.result_store import ResultStore
+import asyncio
+import tempfile
+
+data_dir = '../data/'
+
+frequency_job = {'type': 'frequency', 'data': data_dir + 'data.csv', 'expgroup': data_dir + 'expgroup.csv'}
+adaptive_job = {
+    'type': 'adaptive', 'data': data_dir + 'data.csv', 'expgroup': data_dir + 'expgroup.csv',
+    'options': {'survival_backend': 'numpy', 'random_state': 0}
+    }
+
+
+async def run_jobs(cache_dir):
+    result_store = ResultStore(cache_dir)
+    async with JobService(result_store, max_workers=2) as service:
+        async with JobServer(service) as server:
+            async with JobClient(server.port) as client:
+                # identical jobs in flight at the same time are computed once
+                responses = await asyncio.gather(client.submit(frequency_job), client.submit(frequency_job), client.submit(adaptive_job))
+                print([status for status, result in responses])
+                print(responses[0][1])
+                assert sorted(status for status, result in responses[:2])==['computed', 'deduplicated']
+                assert responses[0][1].equals(responses[1][1])
+
+                status, result = await client.submit(adaptive_job)
+                print(status, result.shape)
+                assert status=='cached'
+                assert result.equals(responses[2][1])
+
+                # without an integer random_state, adaptive results are recomputed, never stored
+                unseeded_job = dict(adaptive_job, options={'survival_backend': 'numpy', 'step_percentile': 10.0})
+                statuses = [(await client.submit(unseeded_job))[0] for _ in range(2)]
+                print('Unseeded adaptive job', statuses)
+                assert statuses==['computed', 'computed']
+                assert not service.is_cacheable(unseeded_job)
+                assert len(result_store.keys())==2
+
+                try:
+                    await client.submit({'type': 'unknown', 'data': data_dir + 'data.csv', 'expgroup': data_dir + 'expgroup.csv'})
+                    assert False
+                except RuntimeError as error:
+                    print(error)
+        print(service.statistics)
+        assert service.statistics['nb_computed']==4
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    asyncio.run(run_jobs(cache_dir))
@@ -0,0 +1,30 @@
+from analysis import survival
+from lifelines import KaplanMeierFitter
+import numpy as np
+import pandas as pd
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+tumoral = data.loc[expgroup_tumoral.index, :]
+
+model = survival.Logrank(survival_data=expgroup_tumoral, duration_col='time', event_col='event', backend='numpy')
+thresholds = tumoral.median()
+time_grid = np.linspace(0, expgroup_tumoral['time'].max(), 25)
+curves = model.calculate_kaplan_meier(thresholds, tumoral, time_grid)
+print('Kaplan-Meier curves of', len(curves.features), 'features, survival array', curves.survival.shape)
+print(curves.medians.head())
+print(curves.get_curves('EXO1').head())
+
+for feature in curves.features:
+    feature_curves = curves.get_curves(feature)
+    for group, mask in [('low', tumoral[feature]<=thresholds[feature]), ('high', tumoral[feature]>thresholds[feature])]:
+        fitter = KaplanMeierFitter().fit(expgroup_tumoral.loc[mask, 'time'], expgroup_tumoral.loc[mask, 'event'])
+        expected = fitter.survival_function_at_times(time_grid).to_numpy()
+        assert np.abs(feature_curves['survival_' + group].to_numpy() - expected).max()<1e-12
+        at_risk = np.array([(expgroup_tumoral.loc[mask, 'time']>=t).sum() for t in time_grid])
+        assert np.array_equal(feature_curves['at_risk_' + group].to_numpy(), at_risk)
+        assert curves.medians.loc[feature, 'median_' + group]==fitter.median_survival_time_
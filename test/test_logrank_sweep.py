@@ -0,0 +1,30 @@
+from analysis import survival
+import numpy as np
+import pandas as pd
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+tumoral = data.loc[expgroup_tumoral.index, :]
+
+options = {'survival_data': expgroup_tumoral, 'duration_col': 'time', 'event_col': 'event'}
+lifelines_model = survival.Logrank(**options, backend='lifelines')
+sweep_model = survival.Logrank(**options, backend='numpy')
+
+cuts = sweep_model.calculate_model_for_cuts('EXO1', tumoral)
+print('Log-rank sweep over', cuts.shape[0], 'cuts')
+print(cuts.sort_values(by='p_value').head())
+
+for feature in tumoral.columns:
+    thresholds = tumoral[feature].quantile(np.arange(0.15, 0.86, 0.05)).to_numpy()
+    expected = np.array(lifelines_model.calculate_model_for_thresholds(feature, thresholds, tumoral))
+    swept = np.array(sweep_model.calculate_model_for_thresholds(feature, thresholds, tumoral))
+    single = np.array([sweep_model.calculate_model_for_threshold(feature, threshold, tumoral) for threshold in thresholds])
+    pvalue_error = np.abs(swept[:, 0] - expected[:, 0]).max()
+    print(feature, 'max absolute error p-value', pvalue_error)
+    assert pvalue_error<1e-10
+    assert np.allclose(swept, single)
+    assert np.all((swept[:, 1]>=1.0)==(expected[:, 1]>=1.0))
@@ -0,0 +1,23 @@
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold, assert_same_results
+import pandas as pd
+
+# fast log-rank backend
+data, expgroup = get_cohort(nb_genes=16)
+options = dict(NUMPY_LOGRANK, nb_cross_validations=2, random_state=0)
+serial, serial_thresholds = run_adaptive_threshold(data, expgroup, n_jobs=1, **options)
+parallel, parallel_thresholds = run_adaptive_threshold(data, expgroup, n_jobs=2, **options)
+print('\nThresholds')
+print(pd.DataFrame({'serial': serial_thresholds, 'n_jobs=2': parallel_thresholds}))
+print('Statistics', parallel.statistics)
+assert_same_results(parallel, parallel_thresholds, serial, serial_thresholds)
+assert parallel.statistics==serial.statistics
+
+# default Cox model on lifelines, with the survival cache as most runs use it
+data, expgroup = get_cohort(nb_genes=2, nb_samples=120)
+options = {'step_percentile': 1.0, 'random_state': 0}
+serial, serial_thresholds = run_adaptive_threshold(data, expgroup, n_jobs=1, **options)
+parallel, parallel_thresholds = run_adaptive_threshold(data, expgroup, n_jobs=2, survival_cache_size=1000, **options)
+print('\nCox on lifelines, n_jobs=2 with cache', parallel.statistics)
+assert_same_results(parallel, parallel_thresholds, serial, serial_thresholds)
+assert parallel.statistics['nb_cache_hits']>0
+assert parallel.statistics['nb_models']<serial.statistics['nb_models']
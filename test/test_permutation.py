@@ -0,0 +1,20 @@
+from analysis import threshold
+import pandas as pd
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+tumoral = data.loc[expgroup_tumoral.index, :]
+
+options = {'survival_backend': 'numpy', 'nb_permutations': 500, 'random_state': 0}
+adaptive_threshold = threshold.AdaptiveThreshold(data=tumoral, survival_data=expgroup_tumoral, **options)
+adaptive_threshold.calculate_threshold()
+
+for feature in adaptive_threshold.eligible_features:
+    details = adaptive_threshold.get_details(feature)
+    print('\nRaw and max-statistic adjusted p-values for', feature)
+    print(details[['threshold', 'p_value', 'p_value_adjusted']].sort_values(by='p_value').head())
+    assert details['p_value_adjusted'].min()>=1.0 / (1.0 + options['nb_permutations'])
@@ -0,0 +1,35 @@
+import logging
+import numpy as np
+from analysis.observer import LoggingObserver
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+data, expgroup = get_cohort(nb_genes=60, nb_samples=400)
+options = dict(NUMPY_LOGRANK, random_state=0)
+
+full, full_thresholds = run_adaptive_threshold(data, expgroup, **options)
+
+validated_optimum = [feature for feature in full.eligible_features if full.get_details(feature).query('optimal')['validated'].any()]
+
+# fraction of the features with a validated optimum that each pre-screen may prune at the default cutoff
+for prescreen, max_lost_fraction in [('logrank', 0.0), ('score', 0.1)]:
+    prescreened, prescreened_thresholds = run_adaptive_threshold(data, expgroup, prescreen=prescreen, observer=LoggingObserver(), **options)
+    statistics = prescreened.statistics
+    p_values = prescreened.prescreen_p_values
+    pruned = p_values.index[p_values>0.5]
+    print('\nPre-screen', prescreen, ':', statistics['nb_prescreen_pruned'], 'of', len(prescreened.eligible_features), 'features pruned,',
+          '%.3f s spent, %.3f s saved' % (statistics['prescreen_seconds'], statistics['prescreen_seconds_saved']))
+    assert statistics['nb_prescreen_pruned']==len(pruned)>0
+    assert statistics['nb_threshold_fits']<full.statistics['nb_threshold_fits']
+    # survivors get the full search, pruned features no fit and no optimum
+    for feature in prescreened.eligible_features:
+        details = prescreened.get_details(feature)
+        if feature in pruned:
+            assert details['p_value'].isna().all() and not details['optimal'].any()
+        else:
+            assert details.equals(full.get_details(feature))
+    assert np.isnan(prescreened_thresholds[pruned]).all()
+    nb_lost = len(set(validated_optimum) & set(pruned))
+    print('Validated optima lost by pruning:', nb_lost, 'of', len(validated_optimum))
+    assert nb_lost<=max_lost_fraction * len(validated_optimum)
@@ -0,0 +1,44 @@
+from analysis import threshold
+import os
+import tempfile
+import pandas as pd
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+tumoral = data.loc[expgroup_tumoral.index, :]
+
+adaptive_threshold = threshold.AdaptiveThreshold(data=tumoral, survival_data=expgroup_tumoral, survival_backend='numpy', random_state=0)
+# details are looked up like the former dict, KeyError included
+try:
+    adaptive_threshold.get_details(tumoral.columns[0])
+    raise AssertionError('Details found before calculate_threshold')
+except KeyError as error:
+    print('No details before calculate_threshold:', error)
+assert len(adaptive_threshold.dict_thresholds)==0
+adaptive_thresholds = adaptive_threshold.calculate_threshold()
+dict_thresholds = adaptive_threshold.dict_thresholds
+assert list(dict_thresholds)==adaptive_threshold.eligible_features
+for feature, details in dict_thresholds.items():
+    assert details.equals(adaptive_threshold.get_details(feature))
+assert 'unknown' not in dict_thresholds
+
+results = adaptive_threshold.results
+table = results.to_frame()
+print('\nResults table', table.shape, table.memory_usage(deep=True).sum(), 'bytes')
+print(table.dtypes)
+assert len(table)==sum(len(adaptive_threshold.get_details(feature)) for feature in adaptive_threshold.eligible_features)
+for feature in adaptive_threshold.eligible_features:
+    details = adaptive_threshold.get_details(feature)
+    rows = table[table['feature']==feature].drop(columns=['feature', 'threshold_number'])
+    assert rows.reset_index(drop=True).equals(details.reset_index(drop=True))
+    assert details[details['optimal']]['threshold'].iloc[0]==adaptive_thresholds[feature]
+
+try:
+    with tempfile.TemporaryDirectory() as directory:
+        results.to_feather(os.path.join(directory, 'results.feather'))
+        assert pd.read_feather(os.path.join(directory, 'results.feather')).equals(table)
+except ImportError:
+    print('pyarrow not installed, Feather export not tested')
@@ -0,0 +1,25 @@
+from analysis import survival
+import numpy as np
+import pandas as pd
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+tumoral = data.loc[expgroup_tumoral.index, :]
+
+options = {'survival_data': expgroup_tumoral, 'duration_col': 'time', 'event_col': 'event'}
+expected = survival.Cox(**options, backend='lifelines').screen_expression(tumoral)
+screen = survival.Cox(**options, backend='numpy').screen_expression(tumoral)
+print('\nExpression screen')
+print(screen)
+assert (screen['p_value'] - expected['p_value']).abs().max()<1e-3
+assert ((screen['hazard_ratio'] - expected['hazard_ratio']).abs() / expected['hazard_ratio']).max()<1e-4
+assert (screen['standard_error'] - expected['standard_error']).abs().max()<1e-4
+
+# chunks only bound memory
+chunked = survival.Cox(**options, backend='numpy').screen_expression(tumoral, chunk_size=1)
+assert np.allclose(chunked.to_numpy(), screen.to_numpy(), rtol=1e-12)
+assert (screen['p_value_fdr']>=screen['p_value']).all()
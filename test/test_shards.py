@@ -0,0 +1,54 @@
+from analysis import threshold
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+
+options = dict(NUMPY_LOGRANK, nb_cross_validations=2)
+nb_shards = 3
+
+data, expgroup = get_cohort(nb_genes=12, nb_normal_samples=20)
+expgroup_tumoral = expgroup[expgroup['group']=='tumoral']
+tumoral = data.loc[expgroup_tumoral.index, :]
+expected, expected_thresholds = run_adaptive_threshold(tumoral, expgroup_tumoral, random_state=0, **options)
+
+with tempfile.TemporaryDirectory() as directory:
+    data.to_csv(os.path.join(directory, 'data.csv'), sep=';')
+    expgroup.to_csv(os.path.join(directory, 'expgroup.csv'), sep=';')
+    environment = dict(os.environ, PYTHONPATH=os.path.abspath('..'))
+    shard_paths = [os.path.join(directory, 'shard_' + str(shard_index) + '.pkl') for shard_index in range(nb_shards)]
+    # every shard in its own process, as on separate nodes
+    processes = [
+        subprocess.Popen([
+            sys.executable, '-m', 'main.shard', 'run', os.path.join(directory, 'data.csv'), os.path.join(directory, 'expgroup.csv'),
+            '--shard', str(shard_index), '--nb-shards', str(nb_shards), '--random-state', '0',
+            '--options', json.dumps(options), '--output', shard_paths[shard_index]
+            ], env=environment)
+        for shard_index in range(nb_shards)
+        ]
+    assert all(process.wait()==0 for process in processes)
+
+    merged = threshold.merge_shards(shard_paths)
+    print('\nMerged thresholds')
+    print(pd.DataFrame({'sharded': merged['thresholds'], 'single run': expected_thresholds}))
+    pd.testing.assert_series_equal(merged['thresholds'], expected_thresholds, check_names=False)
+    for feature in expected.eligible_features:
+        pd.testing.assert_frame_equal(merged['results'].get_details(feature), expected.get_details(feature))
+    assert merged['statistics']['nb_fits']==expected.statistics['nb_fits']
+
+    subprocess.run([sys.executable, '-m', 'main.shard', 'merge', *shard_paths, '--output-dir', os.path.join(directory, 'results')], env=environment, check=True)
+    assert os.path.exists(os.path.join(directory, 'results', 'adaptive_details.csv'))
+
+    # shards of another run are refused
+    other = threshold.AdaptiveThreshold(tumoral, expgroup_tumoral, random_state=1, shard_index=0, nb_shards=nb_shards, **options)
+    other.calculate_threshold()
+    other.write_shard(os.path.join(directory, 'other.pkl'))
+    for paths in [shard_paths[:2], [os.path.join(directory, 'other.pkl')] + shard_paths[1:]]:
+        try:
+            threshold.merge_shards(paths)
+            raise AssertionError('Mismatched shards were merged')
+        except ValueError as error:
+            print('Refused:', error)
@@ -0,0 +1,36 @@
+from analysis import threshold
+from analysis.sorted_index import SortedIndex
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold
+import numpy as np
+import pandas as pd
+
+data, expgroup = get_cohort(nb_genes=6, nb_samples=200)
+data = data.copy()
+data.iloc[::7, 0] = np.nan # a feature with unmeasured samples
+feature = data.columns[0]
+
+def baseline_percentile(expression_values, threshold_value):
+    values = expression_values.sort_values().to_numpy()
+    return 100.0 * np.count_nonzero(values<=threshold_value) / len(values)
+
+# percentile of a threshold, from the sorted index or from another Series, NaN counted in the total
+percentile_threshold = threshold.PercentileThreshold(data, 50)
+for threshold_value in [np.nan, -1e9, data[feature].median(), 1e9]:
+    expected = baseline_percentile(data[feature], threshold_value)
+    assert percentile_threshold.get_threshold_percentile(feature, threshold_value)==expected
+    assert percentile_threshold.get_threshold_percentile(data[feature], threshold_value)==expected
+assert threshold.Threshold(data).get_threshold_percentile(data[feature].iloc[:0], 1.0)==0.0
+
+# column lookups sort only the blocks of the requested columns
+sorted_index = SortedIndex(data, block_size=1)
+thresholds = data.median()
+pd.testing.assert_series_equal(sorted_index.percentile_of(thresholds, data.columns[:2]), SortedIndex(data).percentile_of(thresholds).iloc[:2])
+assert sorted_index.nb_cached_values==2 * data.shape[0]
+
+# a feature containing NaN gets the percentiles of its measured samples as thresholds
+adaptive_threshold, _ = run_adaptive_threshold(data, expgroup, step_percentile=5.0, nb_cross_validations=1, random_state=0, **NUMPY_LOGRANK)
+details = adaptive_threshold.get_details(feature)
+print(details[['threshold', 'threshold_percentile', 'p_value']].head())
+assert details['threshold'].notna().all()
+expected = np.nanpercentile(data[feature].to_numpy(), details['threshold_percentile'].to_numpy())
+assert np.allclose(details['threshold'].to_numpy(), expected)
@@ -0,0 +1,88 @@
+from analysis import threshold, streaming
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import warnings
+
+data_dir = '../data/'
+
+expgroup = pd.read_csv(data_dir + 'expgroup.csv', sep=';', index_col='id_sample')
+data = pd.read_csv(data_dir + 'data.csv', sep=';', index_col='id_sample')
+normal = data.loc[expgroup[expgroup['group']=='normal'].index, :]
+tumoral = data.loc[expgroup[expgroup['group']=='tumoral'].index, :]
+chunks = [normal.iloc[start:start + 7, :] for start in range(0, normal.shape[0], 7)]
+
+def get_rank_error(data: pd.DataFrame, thresholds: pd.Series, percentile: float) -> float:
+    """Largest distance between percentile and the percentage of values <= threshold of each feature"""
+    return ((100.0 * (data<=thresholds).sum() / data.notna().sum()) - percentile).abs().max()
+
+def fit_chunk(chunk: pd.DataFrame) -> streaming.StreamingThreshold:
+    return streaming.StreamingStdDecorator(streaming.StreamingMeanThreshold(), nb_std=2).partial_fit(chunk)
+
+# === Chunks in sequence ===
+m2sd = streaming.StreamingStdDecorator(streaming.StreamingMeanThreshold(), nb_std=2)
+max_normal = streaming.StreamingMaxThreshold()
+p90 = streaming.StreamingPercentileThreshold(90.0, lower=0.0, upper=10.0, nb_bins=1000)
+for chunk in chunks:
+    for streaming_threshold in [m2sd, max_normal, p90]:
+        streaming_threshold.partial_fit(chunk)
+
+expected_m2sd = threshold.StdDecorator(threshold.MeanTreshold(normal), nb_std=2).calculate_threshold()
+expected_p90 = threshold.PercentileThreshold(normal, 90.0).calculate_threshold()
+print('\nStreaming and batch thresholds of', len(chunks), 'chunks')
+print(pd.DataFrame({'m2sd': m2sd.calculate_threshold(), 'batch_m2sd': expected_m2sd, 'p90': p90.calculate_threshold(), 'batch_p90': expected_p90}))
+assert np.allclose(m2sd.calculate_threshold(), expected_m2sd, rtol=1e-12)
+assert max_normal.calculate_threshold().equals(threshold.MaxTreshold(normal).calculate_threshold())
+assert (p90.calculate_threshold() - expected_p90).abs().max()<=10.0/1000
+
+
+# === Rank-error sketch, the default ===
+# exact up to k samples
+p90_sketch = streaming.StreamingPercentileThreshold(90.0)
+for chunk in chunks:
+    p90_sketch.partial_fit(chunk)
+assert np.allclose(p90_sketch.calculate_threshold(), expected_p90, rtol=1e-12)
+
+# rank error of about 2 n / k beyond, whatever the scale of a feature
+tumoral_chunks = [tumoral.iloc[start:start + 50, :] for start in range(0, tumoral.shape[0], 50)]
+p90_tumoral = streaming.StreamingPercentileThreshold(90.0, random_state=0)
+p90_low = streaming.StreamingPercentileThreshold(90.0, random_state=0)
+for chunk in tumoral_chunks:
+    p90_tumoral.partial_fit(chunk)
+    p90_low.partial_fit(chunk / 1000.0)
+rank_error = get_rank_error(tumoral, p90_tumoral.calculate_threshold(), 90.0)
+print('Rank error of the sketch on', tumoral.shape[0], 'samples:', round(rank_error, 2), 'percentiles')
+assert rank_error<=100.0 * 2 * 2 / 200
+assert np.allclose(p90_low.calculate_threshold() * 1000.0, p90_tumoral.calculate_threshold(), rtol=1e-12)
+
+# sketches of separate chunks merge with the same error
+merged_sketch = streaming.StreamingPercentileThreshold(90.0, random_state=0)
+for chunk in tumoral_chunks:
+    merged_sketch.merge(streaming.StreamingPercentileThreshold(90.0, random_state=0).partial_fit(chunk))
+assert get_rank_error(tumoral, merged_sketch.calculate_threshold(), 90.0)<=100.0 * 2 * 2 / 200
+
+# === Histogram ranges ===
+# one range per feature, and a warning for the features with values outside it
+p90_ranges = streaming.StreamingPercentileThreshold(90.0, lower=normal.min(), upper=normal.max())
+p90_clamped = streaming.StreamingPercentileThreshold(90.0, lower=0.0, upper=1.0)
+for chunk in chunks:
+    p90_ranges.partial_fit(chunk)
+    p90_clamped.partial_fit(chunk)
+bin_widths = (normal.max() - normal.min()) / 1000
+assert ((p90_ranges.calculate_threshold() - expected_p90).abs()<=bin_widths + 1e-12).all()
+with warnings.catch_warnings(record=True) as clamp_warnings:
+    warnings.simplefilter('always')
+    p90_ranges.calculate_threshold()
+    assert len(clamp_warnings)==0
+    p90_clamped.calculate_threshold()
+print('Clamped:', clamp_warnings[0].message)
+assert len(clamp_warnings)==1
+
+# === Chunks in parallel, then merged ===
+if __name__ == '__main__':
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        partial_thresholds = list(executor.map(fit_chunk, chunks))
+    merged = streaming.StreamingStdDecorator(streaming.StreamingMeanThreshold(), nb_std=2)
+    for partial_threshold in partial_thresholds:
+        merged.merge(partial_threshold)
+    assert np.allclose(merged.calculate_threshold(), expected_m2sd, rtol=1e-12)
@@ -0,0 +1,14 @@
+from test.synthetic_cohort import NUMPY_LOGRANK, get_cohort, run_adaptive_threshold, assert_same_results
+
+data, expgroup = get_cohort(nb_genes=8, nb_samples=200)
+options = dict(NUMPY_LOGRANK, step_percentile=0.1, nb_cross_validations=2, random_state=0)
+
+uncached, uncached_thresholds = run_adaptive_threshold(data, expgroup, **options)
+cached, cached_thresholds = run_adaptive_threshold(data, expgroup, survival_cache_size=500, **options)
+
+# at a 0.1 percentile step, neighbouring thresholds often split the samples identically
+cache_statistics = cached.survival_cache_statistics
+print('\nCache', cache_statistics)
+assert cache_statistics['hits']>0
+assert cache_statistics['size']<=cache_statistics['max_size']
+assert_same_results(cached, cached_thresholds, uncached, uncached_thresholds)